@@ -1,5 +1,27 @@
 from django.contrib import admin
-from .models import CustomUser, Client
+from .jobs import enqueue_once
+from .models import CustomUser, Client, DoctorInbox, Job, MedicalRecord
+
+
+class ClientAdmin(admin.ModelAdmin):
+    # Admin edits skip the inbox bookkeeping the portal views do; have the
+    # job worker recount the doctors' inboxes afterwards
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        enqueue_once('reconcile_inboxes')
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        enqueue_once('reconcile_inboxes')
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        enqueue_once('reconcile_inboxes')
+
 
 admin.site.register(CustomUser)
-admin.site.register(Client)
+admin.site.register(Client, ClientAdmin)
+admin.site.register(DoctorInbox)
+admin.site.register(MedicalRecord)
+admin.site.register(Job)
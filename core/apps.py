@@ -1,6 +1,44 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .search import ensure_search_indexes
+        post_migrate.connect(ensure_search_indexes, sender=self)
+
+        from .auth import invalidate_cached_user
+        from .directory import invalidate_doctor_directory
+        from .models import CustomUser
+        post_save.connect(invalidate_cached_user, sender=CustomUser)
+        post_delete.connect(invalidate_cached_user, sender=CustomUser)
+        post_save.connect(invalidate_doctor_directory, sender=CustomUser)
+        post_delete.connect(invalidate_doctor_directory, sender=CustomUser)
+
+        from .daily_stats import TRACKED_FIELDS, record_delete, record_save, remember_values
+        for model in TRACKED_FIELDS:
+            post_init.connect(remember_values, sender=model)
+            post_save.connect(record_save, sender=model)
+            post_delete.connect(record_delete, sender=model)
+
+        from .changes import record_tombstone
+        from .models import Client
+        post_delete.connect(record_tombstone, sender=Client)
+
+        from .db import log_pool_stats
+        request_finished.connect(log_pool_stats)
+
+        from django.conf import settings
+        if settings.DB_SIMULATED_LATENCY_MS:
+            # Only on servers started for a benchmark (README: Benchmarking)
+            from .benchmark import simulate_latency
+            connection_created.connect(simulate_latency)
+
+        if settings.SERVER_TIMING or settings.METRICS_ENABLED:
+            from .timing import install_query_recorder
+            connection_created.connect(install_query_recorder)
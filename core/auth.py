@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+
+
+def user_cache():
+    return caches[settings.AUTH_USER_CACHE]
+
+
+def user_cache_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose per-request user lookup (get_user, called by
+    AuthenticationMiddleware for every logged-in request) is served from
+    the cache for AUTH_USER_CACHE_TIMEOUT seconds.
+
+    Django still compares the session's auth hash with the cached user's
+    password hash, and every save or delete of a user drops its entry, so
+    a password change logs out other sessions on their next request.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and username is not None and password is not None:
+            # ModelBackend, listed after us for older sessions, would only
+            # hash the same wrong password again
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = user_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache().set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await user_cache().aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await user_cache().aset(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    # post_save / post_delete receiver for CustomUser
+    user_cache().delete(user_cache_key(instance.pk))
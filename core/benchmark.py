@@ -0,0 +1,328 @@
+import asyncio
+import os
+import random
+import resource
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client as TestClient
+from django.utils.crypto import get_random_string
+
+from .models import Client, CustomUser
+
+SEARCH_TERMS = ['abe', 'Sel', 'tes', 'meron', '0911', '+25192', 'hai', 'li']
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def current_rss_mb(pid=None):
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def allowed_host():
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'testserver'
+    return 'testserver' if host == '*' else host.lstrip('.')
+
+
+class Scenario:
+    def __init__(self, name, user, build):
+        self.name = name
+        self.user = user
+        self.build = build
+
+
+def build_scenarios(doctor, receptionist, client_ids, doctor_ids, rng):
+    xhr = {'X-Requested-With': 'XMLHttpRequest'}
+    return {
+        'dashboard': Scenario('dashboard', doctor, lambda: ('GET', '/dashboard/', None, {})),
+        'search': Scenario('search', receptionist, lambda: (
+            'GET', '/dashboard/?' + urllib.parse.urlencode({'q': rng.choice(SEARCH_TERMS)}), None, xhr
+        )),
+        'check_notifications': Scenario('check_notifications', doctor, lambda: (
+            'GET', '/check-notifications/', None, xhr
+        )),
+        'refer_client': Scenario('refer_client', receptionist, lambda: (
+            'POST', '/refer-client/', {
+                'client_id': rng.choice(client_ids),
+                'referred_to': rng.choice(doctor_ids),
+                'referral_notes': 'benchmark',
+            }, xhr
+        )),
+        'client_view': Scenario('client_view', doctor, lambda: (
+            'GET', f"/client/{rng.choice(client_ids)}/view/", None, {}
+        )),
+    }
+
+
+class InProcessTransport:
+    """Drives the views through Django's test client, counting SQL per request."""
+
+    name = 'test-client'
+
+    def __init__(self):
+        self.local = threading.local()
+        self.host = allowed_host()
+
+    def client_for(self, user):
+        clients = self.local.__dict__.setdefault('clients', {})
+        if user.pk not in clients:
+            client = TestClient(HTTP_HOST=self.host, enforce_csrf_checks=False)
+            client.force_login(user)
+            clients[user.pk] = client
+        return clients[user.pk]
+
+    def request(self, user, method, path, data, headers):
+        client = self.client_for(user)
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            if method == 'POST':
+                response = client.post(path, data, headers=headers)
+            else:
+                response = client.get(path, headers=headers)
+        return response.status_code, len(queries)
+
+
+class ASGITransport:
+    """
+    Drives the async request path in this process: one event loop, like a
+    single uvicorn worker, with each request in its own sync thread context
+    as ASGIHandler does. Queries run in those threads, so they aren't counted.
+    """
+
+    name = 'asgi'
+
+    def __init__(self):
+        self.clients = {}
+        # AsyncClient always sends Host: testserver; allow it the way
+        # setup_test_environment() does for the test suite
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+    async def client_for(self, user):
+        if user.pk not in self.clients:
+            client = AsyncClient(enforce_csrf_checks=False)
+            await client.aforce_login(user)
+            self.clients[user.pk] = client
+        return self.clients[user.pk]
+
+    async def arequest(self, user, method, path, data, headers):
+        client = await self.client_for(user)
+        async with ThreadSensitiveContext():
+            if method == 'POST':
+                response = await client.post(path, data, headers=headers)
+            else:
+                response = await client.get(path, headers=headers)
+        return response.status_code, None
+
+
+class HTTPTransport:
+    """Drives a running server (e.g. local gunicorn) over HTTP using sessions minted here."""
+
+    name = 'http'
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = {}
+
+    def cookie_for(self, user):
+        if user.pk not in self.cookies:
+            client = TestClient()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            csrf = get_random_string(32)
+            self.cookies[user.pk] = (
+                f"{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={csrf}",
+                csrf,
+            )
+        return self.cookies[user.pk]
+
+    def request(self, user, method, path, data, headers):
+        cookie, csrf = self.cookie_for(user)
+        headers = {**headers, 'Cookie': cookie, 'X-CSRFToken': csrf, 'Referer': self.base_url + '/'}
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+def summarize(requests, wall, timings, query_counts, errors):
+    timings.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / wall, 1) if wall else None,
+        'latency_ms': {
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'mean': round(sum(timings) / len(timings), 2),
+            'max': round(timings[-1], 2),
+        },
+        'queries_per_request': {
+            'mean': round(sum(query_counts) / len(query_counts), 2),
+            'max': max(query_counts),
+        } if query_counts else None,
+    }
+
+
+def run_scenario(transport, scenario, requests, concurrency, workers=None):
+    # Each thread is a client; with workers < concurrency the extra clients
+    # simply wait, as they would behind that many sync gunicorn workers
+    timings, query_counts, errors = [], [], 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        method, path, data, headers = scenario.build()
+        start = time.perf_counter()
+        try:
+            status, queries = transport.request(scenario.user, method, path, data, headers)
+        except Exception:
+            status, queries = None, None
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            timings.append(elapsed)
+            if queries is not None:
+                query_counts.append(queries)
+            if status is None or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(concurrency, workers or concurrency)) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    return summarize(requests, wall, timings, query_counts, errors)
+
+
+async def arun_scenario(transport, scenario, requests, concurrency):
+    # ``concurrency`` requests in flight at once on a single event loop
+    timings, errors = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with slots:
+            method, path, data, headers = scenario.build()
+            start = time.perf_counter()
+            try:
+                status, _ = await transport.arequest(scenario.user, method, path, data, headers)
+            except Exception:
+                status = None
+            timings.append((time.perf_counter() - start) * 1000)
+            if status is None or status >= 400:
+                errors += 1
+
+    # Log in before the clock starts; concurrent first logins would all
+    # race to write a session
+    await transport.client_for(scenario.user)
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - started
+    return summarize(requests, wall, timings, [], errors)
+
+
+def _simulated_round_trip(execute, sql, params, many, context):
+    time.sleep(settings.DB_SIMULATED_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+def simulate_latency(sender, connection, **kwargs):
+    # connection_created receiver: stand in for the round trip to a remote
+    # database. Inserted first so execute_wrapper() blocks (which pop() the
+    # last wrapper) keep working.
+    if settings.DB_SIMULATED_LATENCY_MS and _simulated_round_trip not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _simulated_round_trip)
+
+
+def install_simulated_latency(ms):
+    # For benchmark_portal --db-latency-ms; servers started for a benchmark
+    # get it from DB_SIMULATED_LATENCY_MS instead (CoreConfig.ready)
+    settings.DB_SIMULATED_LATENCY_MS = ms
+    connection_created.connect(simulate_latency)
+    connections.close_all()
+
+
+def run_benchmark(scenario_names, requests, concurrency, base_url=None, server_pid=None, seed=None,
+                  transport='wsgi', workers=None, db_latency_ms=0):
+    rng = random.Random(seed)
+    if db_latency_ms:
+        install_simulated_latency(db_latency_ms)
+    doctor = CustomUser.objects.filter(user_type='doctor').order_by('id').first()
+    receptionist = CustomUser.objects.filter(user_type='receptionist').order_by('id').first()
+    if doctor is None or receptionist is None:
+        raise ValueError("Need at least one doctor and one receptionist; run seed_clinic first")
+
+    # Newest ids via the pk index; enough variety without scanning the table
+    client_ids = list(Client.objects.order_by('-id').values_list('id', flat=True)[:10000])
+    if not client_ids:
+        raise ValueError("No clients to benchmark against; run seed_clinic first")
+    doctor_ids = list(CustomUser.objects.filter(user_type='doctor').values_list('id', flat=True))
+
+    scenarios = build_scenarios(doctor, receptionist, client_ids, doctor_ids, rng)
+    if base_url:
+        transport = HTTPTransport(base_url)
+    elif transport == 'asgi':
+        transport = ASGITransport()
+    else:
+        transport = InProcessTransport()
+
+    results = {}
+    for name in scenario_names:
+        if transport.name == 'asgi':
+            results[name] = asyncio.run(arun_scenario(transport, scenarios[name], requests, concurrency))
+        else:
+            results[name] = run_scenario(transport, scenarios[name], requests, concurrency, workers)
+        results[name]['rss_mb'] = current_rss_mb(server_pid)
+
+    return {
+        'meta': {
+            'transport': transport.name,
+            'base_url': base_url,
+            'requests_per_scenario': requests,
+            'concurrency': concurrency,
+            'workers': workers if transport.name != 'asgi' else 1,
+            'db_latency_ms': db_latency_ms,
+            'database': connection.vendor,
+            'client_rows': Client.objects.count(),
+            'pid': server_pid or os.getpid(),
+        },
+        'scenarios': results,
+        'peak_rss_mb': None if server_pid else peak_rss_mb(),
+    }
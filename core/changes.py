@@ -0,0 +1,95 @@
+import base64
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Client, ClientTombstone
+from .replica import replica_lag
+
+MAX_CHANGES = 200
+# Rows committed up to this long after they were stamped are still
+# picked up: the last poll's cursor is held back by this much
+CHANGES_OVERLAP = timedelta(seconds=5)
+
+Changes = namedtuple('Changes', ['clients', 'created', 'deleted', 'cursor', 'more'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(updated_at, client_id=0):
+    raw = f"{updated_at.isoformat()}|{client_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        updated_at, client_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        updated_at, client_id = datetime.fromisoformat(updated_at), int(client_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    # encode_cursor() always writes an offset; anything else was made up
+    if timezone.is_naive(updated_at):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return updated_at, client_id
+
+
+def current_cursor():
+    # For a page about to be rendered: everything after it comes as changes,
+    # including what a lagging replica hadn't caught up with yet
+    return encode_cursor(timezone.now() - CHANGES_OVERLAP - replica_lag())
+
+
+def client_changes(cursor, limit=MAX_CHANGES):
+    """
+    Clients saved and deleted after ``cursor``, as Changes: the saved
+    clients, ids of those among them created since, deleted ids, the next
+    cursor and whether more are waiting. Clients are keyset-ordered on
+    (updated_at, id), so a burst of changes comes in pages of ``limit``
+    with ``more`` set. Rows near the end of the window are sent again on
+    the next poll; applying a change twice is harmless. Raises
+    InvalidCursor, including for cursors older than the tombstone
+    retention (the caller should reload).
+
+    A cursor of None starts from the beginning: every client, no deletes.
+    """
+    now = timezone.now()
+    if cursor is None:
+        since, since_id = datetime.min.replace(tzinfo=dt_timezone.utc), 0
+    else:
+        since, since_id = decode_cursor(cursor)
+        if since < now - timedelta(days=settings.CLIENT_TOMBSTONE_RETENTION_DAYS):
+            raise InvalidCursor("Cursor is older than the change history")
+
+    clients = list(
+        Client.objects.select_related('created_by', 'referred_to')
+        .filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=since_id))
+        .order_by('updated_at', 'id')[:limit + 1]
+    )
+    more = len(clients) > limit
+    clients = clients[:limit]
+    deleted = []
+    if cursor is not None:
+        deleted = list(
+            ClientTombstone.objects.filter(deleted_at__gt=since).values_list('client_id', flat=True)
+        )
+
+    if more:
+        next_cursor = encode_cursor(clients[-1].updated_at, clients[-1].id)
+    else:
+        next_cursor = encode_cursor(max(since, now - CHANGES_OVERLAP))
+    created = [client.id for client in clients if client.created_at > since]
+    return Changes(clients, created, deleted, next_cursor, more)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    # post_delete receiver for Client; prunes expired tombstones as it goes
+    # (deletes are rare, so this costs nothing on the hot paths)
+    ClientTombstone.objects.create(client_id=instance.pk)
+    cutoff = timezone.now() - timedelta(days=settings.CLIENT_TOMBSTONE_RETENTION_DAYS)
+    ClientTombstone.objects.filter(deleted_at__lt=cutoff).delete()
@@ -0,0 +1,93 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Subquery
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .directory import directory_token
+from .models import Client, ClientTombstone
+
+
+def make_etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def clients_version_query():
+    # The newest updated_at and the newest tombstone id, one row off two
+    # indexes: any save bumps the first, any delete the second. Read as
+    # ORDER BY ... LIMIT 1 rather than aggregates, which would scan the table.
+    last_deleted = ClientTombstone.objects.order_by('-id').values('id')[:1]
+    # An empty table gives None, which no other state does
+    return Client.objects.order_by('-updated_at').values_list('updated_at').annotate(
+        deleted=Subquery(last_deleted)
+    )
+
+
+def clients_version():
+    return str(clients_version_query().first())
+
+
+async def aclients_version():
+    return str(await clients_version_query().afirst())
+
+
+def page_etag_parts(request, user=None):
+    # Everything a rendered page depends on besides the data itself: the
+    # user, today's date (for the "today" stats), the query string and the
+    # CSRF secret embedded in forms. Async views pass the user they got
+    # from request.auser(), since request.user would hit the DB synchronously.
+    user = user or request.user
+    return (
+        user.pk,
+        user.user_type,
+        timezone.localdate(),
+        request.get_full_path(),
+        request.headers.get('X-Requested-With', ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    )
+
+
+def dashboard_etag(request):
+    # The full page also lists doctors in the referral modal
+    return make_etag('dashboard', clients_version(), directory_token(), *page_etag_parts(request))
+
+
+async def adashboard_etag(request, user):
+    return make_etag('dashboard', await aclients_version(), *page_etag_parts(request, user))
+
+
+def pending_referrals_etag(request):
+    return make_etag('pending', clients_version(), *page_etag_parts(request))
+
+
+def client_etag(request, client_id):
+    updated_at = Client.objects.filter(id=client_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        # Let the view raise its 404
+        return None
+    return make_etag('client', client_id, updated_at, *page_etag_parts(request))
+
+
+def acondition(etag_func):
+    """
+    django.views.decorators.http.condition for async views: etag_func is
+    awaited (Django's version calls it synchronously, which the async ORM
+    can't serve) and receives the user from request.auser().
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            user = await request.auser()
+            etag = await etag_func(request, user, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
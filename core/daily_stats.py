@@ -0,0 +1,181 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import Count, F
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .jobs import enqueue_once
+from .models import Client, DailyClinicStats, MedicalRecord
+
+# Timestamp field -> DailyClinicStats counter, per model
+TRACKED_FIELDS = {
+    Client: {
+        'created_at': 'new_clients',
+        'referred_at': 'referrals_created',
+        'referral_completed_at': 'referrals_completed',
+    },
+    MedicalRecord: {
+        'diagnosed_at': 'diagnosed',
+    },
+}
+COUNTERS = ('new_clients', 'referrals_created', 'referrals_completed', 'diagnosed')
+
+
+def stats_day(value):
+    return timezone.localtime(value).date()
+
+
+def adjust_day(day, deltas):
+    # One UPDATE for all of a day's counters; the first write of a day
+    # inserts the row first (ignore_conflicts covers a concurrent insert)
+    changes = {counter: Greatest(F(counter) + delta, 0) for counter, delta in deltas.items()}
+    if not DailyClinicStats.objects.filter(day=day).update(**changes):
+        DailyClinicStats.objects.bulk_create([DailyClinicStats(day=day)], ignore_conflicts=True)
+        DailyClinicStats.objects.filter(day=day).update(**changes)
+
+
+def apply_deltas(deltas):
+    by_day = {}
+    for (day, counter), delta in deltas.items():
+        if delta:
+            by_day.setdefault(day, {})[counter] = delta
+    for day, changes in sorted(by_day.items()):
+        adjust_day(day, changes)
+
+
+def tracked_values(instance):
+    # From __dict__, so deferred fields are skipped rather than loaded
+    fields = TRACKED_FIELDS[type(instance)]
+    return {field: instance.__dict__[field] for field in fields if field in instance.__dict__}
+
+
+def remember_values(sender, instance, **kwargs):
+    # post_init receiver: what the row held when it was loaded
+    instance._stats_values = tracked_values(instance)
+
+
+def record_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    post_save receiver: move the saved row's days between counters, e.g.
+    completing a referral adds one to today's referrals_completed and
+    re-referring a client moves it from the old referred_at day to today.
+    """
+    new = tracked_values(instance)
+    old = dict.fromkeys(new) if created else instance._stats_values
+    written = {
+        field: value for field, value in new.items()
+        if update_fields is None or field in update_fields
+    }
+    if any(field not in old for field in written):
+        # Deferred when loaded, so the day it moves from is unknown: leave
+        # it to a recount by the job worker
+        enqueue_once('rebuild_daily_stats')
+        written = {field: value for field, value in written.items() if field in old}
+    deltas = Counter()
+    count_changes(deltas, sender, old, written)
+    apply_deltas(deltas)
+    instance._stats_values = new
+
+
+def count_changes(deltas, model, old, new):
+    # Move each field in ``new`` from its old value's day to its new one
+    for field, value in new.items():
+        if old[field] == value:
+            continue
+        counter = TRACKED_FIELDS[model][field]
+        if old[field] is not None:
+            deltas[stats_day(old[field]), counter] -= 1
+        if value is not None:
+            deltas[stats_day(value), counter] += 1
+
+
+def record_updates(model, changes):
+    """
+    Count rows changed with QuerySet.update(), which sends no signals.
+    ``changes`` holds (old, new) dicts of the tracked fields written.
+    """
+    deltas = Counter()
+    for old, new in changes:
+        count_changes(deltas, model, old, new)
+    apply_deltas(deltas)
+
+
+def record_delete(sender, instance, **kwargs):
+    deltas = Counter()
+    for field, value in instance._stats_values.items():
+        if value is not None:
+            deltas[stats_day(value), TRACKED_FIELDS[sender][field]] -= 1
+    apply_deltas(deltas)
+
+
+def record_created(instances):
+    """
+    Count rows written with bulk_create(), which sends no signals. Call
+    after the bulk_create, in the same transaction.
+    """
+    deltas = Counter()
+    for instance in instances:
+        for field, counter in TRACKED_FIELDS[type(instance)].items():
+            value = getattr(instance, field)
+            if value is not None:
+                deltas[stats_day(value), counter] += 1
+    apply_deltas(deltas)
+
+
+def today_stats():
+    # Primary-key lookup; a day without activity has no row yet
+    return DailyClinicStats.objects.filter(day=timezone.localdate()).first() or DailyClinicStats()
+
+
+async def atoday_stats():
+    return await DailyClinicStats.objects.filter(day=timezone.localdate()).afirst() or DailyClinicStats()
+
+
+def daily_stats(days=30):
+    """The last ``days`` days, oldest first, with empty days filled in as zeros."""
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    stored = {stats.day: stats for stats in DailyClinicStats.objects.filter(day__gte=start, day__lte=end)}
+    return [stored.get(start + timedelta(days=i)) or DailyClinicStats(day=start + timedelta(days=i))
+            for i in range(days)]
+
+
+def actual_daily_stats():
+    # Recount every day from the source tables, one GROUP BY per counter
+    actual = {}
+    for model, fields in TRACKED_FIELDS.items():
+        for field, counter in fields.items():
+            rows = model.objects.filter(**{f'{field}__isnull': False}).order_by().annotate(
+                stats_day=TruncDate(field)
+            ).values('stats_day').annotate(count=Count('pk'))
+            for row in rows:
+                actual.setdefault(row['stats_day'], dict.fromkeys(COUNTERS, 0))[counter] = row['count']
+    return actual
+
+
+def rebuild_daily_stats(dry_run=False):
+    """
+    Recount DailyClinicStats from Client and MedicalRecord and repair
+    drifted days. Returns a list of (day, stored, actual) tuples that
+    differed, the counts as dicts.
+    """
+    actual = actual_daily_stats()
+    stored = {
+        row['day']: {counter: row[counter] for counter in COUNTERS}
+        for row in DailyClinicStats.objects.values('day', *COUNTERS)
+    }
+
+    zero = dict.fromkeys(COUNTERS, 0)
+    drift = []
+    for day in sorted(set(actual) | set(stored)):
+        counts = actual.get(day, zero)
+        if stored.get(day, zero) == counts:
+            continue
+        drift.append((day, stored.get(day), counts))
+        if not dry_run:
+            if counts == zero:
+                DailyClinicStats.objects.filter(day=day).delete()
+            else:
+                DailyClinicStats.objects.update_or_create(day=day, defaults=counts)
+    return drift
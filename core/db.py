@@ -0,0 +1,49 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_last_logged = time.monotonic()
+
+
+def pool_stats(alias='default', reset=False):
+    """
+    psycopg_pool counters for this worker process, or None when the
+    connection isn't pooled (SQLite, DB_POOL_MODE=persistent/none).
+    """
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    return pool.pop_stats() if reset else pool.get_stats()
+
+
+def log_pool_stats(sender=None, **kwargs):
+    # request_finished receiver: at most one line per DB_POOL_STATS_INTERVAL
+    # per worker. requests_waiting / requests_wait_ms climbing means the
+    # workers want more connections than pool_max gives them.
+    global _last_logged
+    interval = settings.DB_POOL_STATS_INTERVAL
+    if not interval or time.monotonic() - _last_logged < interval:
+        return
+    with _lock:
+        if time.monotonic() - _last_logged < interval:
+            return
+        _last_logged = time.monotonic()
+    stats = pool_stats(reset=True)
+    if stats is not None:
+        logger.info("db pool pid=%s %s", os.getpid(), ' '.join(f"{k}={v}" for k, v in sorted(stats.items())))
+
+
+def release_connection():
+    # Give this thread's connection back to the pool (or close it) now rather
+    # than at request_finished. For long-lived async work like the SSE
+    # stream, which would otherwise hold one for its whole life.
+    if not connection.in_atomic_block:
+        connection.close()
+
@@ -0,0 +1,88 @@
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import CustomUser
+
+# Bump when the cached shape changes so old entries are ignored
+DIRECTORY_VERSION = 1
+DIRECTORY_KEY = 'doctor_directory'
+
+# Same attribute names as the model, so templates read doctor.id / doctor.username
+Doctor = namedtuple('Doctor', ['id', 'username'])
+
+
+def directory_cache():
+    return caches[settings.DOCTOR_DIRECTORY_CACHE]
+
+
+def build_directory():
+    doctors = CustomUser.objects.filter(user_type='doctor').order_by('username').values_list('id', 'username')
+    return {'token': uuid.uuid4().hex, 'doctors': [Doctor(*row) for row in doctors]}
+
+
+async def abuild_directory():
+    doctors = CustomUser.objects.filter(user_type='doctor').order_by('username').values_list('id', 'username')
+    return {'token': uuid.uuid4().hex, 'doctors': [Doctor(*row) async for row in doctors]}
+
+
+def directory_entry():
+    """
+    {'token', 'doctors'}: every doctor as (id, username), rebuilt with one
+    query after a user is saved or deleted. The token changes with each
+    rebuild, so ETags over pages that list doctors can include it.
+    """
+    cache = directory_cache()
+    entry = cache.get(DIRECTORY_KEY, version=DIRECTORY_VERSION)
+    if entry is None:
+        entry = build_directory()
+        cache.set(DIRECTORY_KEY, entry, settings.DOCTOR_DIRECTORY_TIMEOUT, version=DIRECTORY_VERSION)
+    return entry
+
+
+async def adirectory_entry():
+    cache = directory_cache()
+    entry = await cache.aget(DIRECTORY_KEY, version=DIRECTORY_VERSION)
+    if entry is None:
+        entry = await abuild_directory()
+        await cache.aset(DIRECTORY_KEY, entry, settings.DOCTOR_DIRECTORY_TIMEOUT, version=DIRECTORY_VERSION)
+    return entry
+
+
+def doctor_directory():
+    return directory_entry()['doctors']
+
+
+def directory_token():
+    return directory_entry()['token']
+
+
+def lookup_doctor(doctors, doctor_id):
+    # The Doctor with this id, or None; ids come straight from POST data
+    try:
+        doctor_id = int(doctor_id)
+    except (TypeError, ValueError):
+        return None
+    for doctor in doctors:
+        if doctor.id == doctor_id:
+            return doctor
+    return None
+
+
+def find_doctor(doctor_id):
+    return lookup_doctor(doctor_directory(), doctor_id)
+
+
+async def afind_doctor(doctor_id):
+    entry = await adirectory_entry()
+    return lookup_doctor(entry['doctors'], doctor_id)
+
+
+def invalidate_doctor_directory(sender, instance, update_fields=None, **kwargs):
+    # post_save / post_delete receiver for CustomUser. Logins only touch
+    # last_login, which the directory doesn't hold.
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    directory_cache().delete(DIRECTORY_KEY, version=DIRECTORY_VERSION)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .db import release_connection
+from .inbox import apending_count
+
+
+class Broker:
+    """
+    In-process pub/sub. Publishers may run in any thread (sync views);
+    each subscriber is an asyncio.Queue owned by the event loop serving
+    its stream. Events only reach streams in the same worker process,
+    which is why referral_stream() also re-reads the inbox on a timer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=100))
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            self._subscribers[channel].discard(subscriber)
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_nowait, queue, event)
+            except RuntimeError:
+                # Loop already closed; the stream is going away anyway
+                pass
+
+
+def _put_nowait(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # A slow consumer will still catch up from the inbox counters
+        pass
+
+
+broker = Broker()
+
+
+def doctor_channel(doctor_id):
+    return f"doctor:{doctor_id}"
+
+
+def publish_referral_change(*doctor_ids):
+    # Deliver only once the counter update is committed and visible
+    def publish():
+        for doctor_id in set(doctor_ids):
+            if doctor_id is not None:
+                broker.publish(doctor_channel(doctor_id), {'type': 'referrals'})
+    transaction.on_commit(publish)
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def referral_stream(doctor_id):
+    """
+    Server-Sent Events for one doctor. Sends the pending count on connect
+    and whenever it changes, waking on published events or, failing that,
+    every SSE_POLL_INTERVAL seconds. Closes after SSE_MAX_AGE seconds and
+    lets EventSource reconnect, so connections don't pin a worker forever.
+    """
+    loop = asyncio.get_running_loop()
+    channel = doctor_channel(doctor_id)
+    subscriber = broker.subscribe(channel)
+    deadline = loop.time() + settings.SSE_MAX_AGE
+    last_pending = None
+
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+        while loop.time() < deadline:
+            pending = await apending_count(doctor_id)
+            # Don't hold a pooled connection while waiting for the next tick
+            await sync_to_async(release_connection)()
+            if pending != last_pending:
+                yield format_event('referrals', {'pending_referrals': pending})
+                last_pending = pending
+
+            try:
+                await asyncio.wait_for(subscriber[1].get(), timeout=settings.SSE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(channel, subscriber)
@@ -0,0 +1,124 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Client
+
+# (column, lookup) pairs read straight from the database with values_list
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('age', 'age'),
+    ('gender', 'gender'),
+    ('email', 'email'),
+    ('phone', 'phone'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('created_by', 'created_by__username'),
+    ('is_referred', 'is_referred'),
+    ('referral_status', 'referral_status'),
+    ('referred_to', 'referred_to__username'),
+    ('referred_at', 'referred_at'),
+    ('referral_completed_at', 'referral_completed_at'),
+    ('diagnosis', 'medical_record__diagnosis'),
+    ('treatment_plan', 'medical_record__treatment_plan'),
+    ('prescriptions', 'medical_record__prescriptions'),
+    ('doctor_notes', 'medical_record__doctor_notes'),
+    ('referral_notes', 'medical_record__referral_notes'),
+]
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+STATUSES = [value for value, _ in Client.REFERRAL_STATUS_CHOICES]
+CHUNK_SIZE = 2000
+ROWS_PER_WRITE = 500
+# Excel and friends run a CSV cell starting with one of these as a formula.
+# Phone numbers are left alone: they start with '+' and hold only digits.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+CSV_UNESCAPED_COLUMNS = {'phone'}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def day_start(value, name):
+    day = parse_date(value) if value else None
+    if value and day is None:
+        raise ExportError(f"{name} must be a date like 2025-01-31")
+    return day and timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(date_from=None, date_to=None, status=None):
+    # Date range is inclusive of both days, on created_at (indexed)
+    clients = Client.objects.order_by('id')
+    start = day_start(date_from, 'from')
+    end = day_start(date_to, 'to')
+    if start:
+        clients = clients.filter(created_at__gte=start)
+    if end:
+        clients = clients.filter(created_at__lt=end + timedelta(days=1))
+    if status:
+        if status not in STATUSES:
+            raise ExportError(f"status must be one of {', '.join(STATUSES)}")
+        clients = clients.filter(referral_status=status)
+    return clients.values_list(*[lookup for _, lookup in EXPORT_COLUMNS])
+
+
+def csv_safe(value):
+    # A leading ' makes the spreadsheet show the cell as text
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class Echo:
+    # csv.writer only needs .write(); hand the line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def export_lines(queryset, fmt, chunk_size=CHUNK_SIZE):
+    """
+    Yield the export as text, a few hundred rows per string. Rows come
+    off a server-side cursor as tuples, so memory stays flat however many
+    there are.
+    """
+    header = [column for column, _ in EXPORT_COLUMNS]
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        escaped = [column not in CSV_UNESCAPED_COLUMNS for column in header]
+
+        def encode(row):
+            return writer.writerow([
+                csv_safe(value) if escape else value for escape, value in zip(escaped, row)
+            ])
+    else:
+        def encode(row):
+            return json.dumps(dict(zip(header, row)), default=str) + '\n'
+
+    buffer = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        buffer.append(encode(row))
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def aiterate(iterator):
+    # StreamingHttpResponse under ASGI would list() a sync iterator, i.e.
+    # buffer the whole export; pull it one piece at a time instead
+    iterator = iter(iterator)
+    done = object()
+    pull = sync_to_async(next)
+    while True:
+        part = await pull(iterator, done)
+        if part is done:
+            break
+        yield part
@@ -1,7 +1,19 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.db import transaction
 from .models import CustomUser, Client
 
+MEDICAL_FIELDS = ['diagnosis', 'treatment_plan', 'prescriptions', 'doctor_notes']
+
+
+def validate_client_phone(phone):
+    # Shared by ClientForm and the import_clients command
+    if not phone.startswith('+2519'):
+        raise forms.ValidationError("Phone number must start with +2519")
+    if len(phone) != 13:  # +2519 + 8 digits = 13 characters
+        raise forms.ValidationError("Phone number must be 13 characters including +2519")
+    return phone
+
 
 class MedicalEditForm(forms.ModelForm):
     phone_suffix = forms.CharField(
@@ -15,9 +27,43 @@ class MedicalEditForm(forms.ModelForm):
         })
     )
     
+    # Stored on MedicalRecord, loaded from client.medical only by this form
+    diagnosis = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'w-full px-4 py-3 border-l-4 border-blue-500 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent transition-all duration-300 bg-blue-50',
+            'placeholder': 'Enter medical diagnosis and findings...',
+            'rows': 4
+        })
+    )
+    treatment_plan = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'w-full px-4 py-3 border-l-4 border-green-500 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent transition-all duration-300 bg-green-50',
+            'placeholder': 'Describe the treatment plan and procedures...',
+            'rows': 4
+        })
+    )
+    prescriptions = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'w-full px-4 py-3 border-l-4 border-purple-500 rounded-lg focus:ring-2 focus:ring-purple-500 focus:border-transparent transition-all duration-300 bg-purple-50',
+            'placeholder': 'List prescribed medications and dosages...',
+            'rows': 4
+        })
+    )
+    doctor_notes = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={
+            'class': 'w-full px-4 py-3 border-l-4 border-orange-500 rounded-lg focus:ring-2 focus:ring-orange-500 focus:border-transparent transition-all duration-300 bg-orange-50',
+            'placeholder': 'Additional observations and follow-up notes...',
+            'rows': 4
+        })
+    )
+    
     class Meta:
         model = Client
-        fields = ['first_name', 'last_name', 'age', 'email', 'gender', 'diagnosis', 'treatment_plan', 'prescriptions', 'doctor_notes']
+        fields = ['first_name', 'last_name', 'age', 'email', 'gender']
         widgets = {
             'first_name': forms.TextInput(attrs={
                 'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-nova-green focus:border-transparent transition-all duration-300',
@@ -40,26 +86,6 @@ class MedicalEditForm(forms.ModelForm):
             'gender': forms.Select(attrs={
                 'class': 'w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-nova-green focus:border-transparent transition-all duration-300'
             }),
-            'diagnosis': forms.Textarea(attrs={
-                'class': 'w-full px-4 py-3 border-l-4 border-blue-500 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent transition-all duration-300 bg-blue-50',
-                'placeholder': 'Enter medical diagnosis and findings...',
-                'rows': 4
-            }),
-            'treatment_plan': forms.Textarea(attrs={
-                'class': 'w-full px-4 py-3 border-l-4 border-green-500 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent transition-all duration-300 bg-green-50',
-                'placeholder': 'Describe the treatment plan and procedures...',
-                'rows': 4
-            }),
-            'prescriptions': forms.Textarea(attrs={
-                'class': 'w-full px-4 py-3 border-l-4 border-purple-500 rounded-lg focus:ring-2 focus:ring-purple-500 focus:border-transparent transition-all duration-300 bg-purple-50',
-                'placeholder': 'List prescribed medications and dosages...',
-                'rows': 4
-            }),
-            'doctor_notes': forms.Textarea(attrs={
-                'class': 'w-full px-4 py-3 border-l-4 border-orange-500 rounded-lg focus:ring-2 focus:ring-orange-500 focus:border-transparent transition-all duration-300 bg-orange-50',
-                'placeholder': 'Additional observations and follow-up notes...',
-                'rows': 4
-            }),
         }
     
     def __init__(self, *args, **kwargs):
@@ -70,6 +96,11 @@ class MedicalEditForm(forms.ModelForm):
             phone_number = self.instance.phone
             if phone_number.startswith('+2519') and len(phone_number) == 13:
                 self.fields['phone_suffix'].initial = phone_number[5:]
+        
+        if self.instance.pk and not self.is_bound:
+            record = self.instance.medical
+            for field in MEDICAL_FIELDS:
+                self.initial.setdefault(field, getattr(record, field))
     
     def clean_phone_suffix(self):
         phone_suffix = self.cleaned_data.get('phone_suffix')
@@ -85,26 +116,13 @@ class MedicalEditForm(forms.ModelForm):
         client = super().save(commit=False)
         phone_suffix = self.cleaned_data.get('phone_suffix')
         client.phone = f"+2519{phone_suffix}"
+        record = client.medical
+        for field in MEDICAL_FIELDS:
+            setattr(record, field, self.cleaned_data.get(field, ''))
         if commit:
-            client.save()
-        return client
-    
-    def clean_phone_suffix(self):
-        phone_suffix = self.cleaned_data.get('phone_suffix')
-        if not phone_suffix:
-            raise forms.ValidationError("Phone number is required")
-        if len(phone_suffix) != 8:
-            raise forms.ValidationError("Please enter exactly 8 digits")
-        if not phone_suffix.isdigit():
-            raise forms.ValidationError("Phone number must contain only digits")
-        return phone_suffix
-    
-    def save(self, commit=True):
-        client = super().save(commit=False)
-        phone_suffix = self.cleaned_data.get('phone_suffix')
-        client.phone = f"+2519{phone_suffix}"
-        if commit:
-            client.save()
+            with transaction.atomic():
+                client.save()
+                record.save()
         return client
 
 class ClientForm(forms.ModelForm):
@@ -222,9 +240,4 @@ class ClientForm(forms.ModelForm):
         fields = ['first_name', 'last_name', 'age', 'email', 'phone', 'gender']
     
     def clean_phone(self):
-        phone = self.cleaned_data.get('phone')
-        if not phone.startswith('+2519'):
-            raise forms.ValidationError("Phone number must start with +2519")
-        if len(phone) != 13:  # +2519 + 8 digits = 13 characters
-            raise forms.ValidationError("Phone number must be 13 characters including +2519")
-        return phone
\ No newline at end of file
+        return validate_client_phone(self.cleaned_data.get('phone'))
\ No newline at end of file
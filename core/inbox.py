@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Client, DoctorInbox
+
+# Referral states that show up in a doctor's inbox counters
+COUNTED_STATUSES = ('pending', 'in_progress')
+
+
+def adjust_inbox(doctor_id, status, delta):
+    if doctor_id is None or status not in COUNTED_STATUSES:
+        return
+
+    updated = DoctorInbox.objects.filter(doctor_id=doctor_id).update(
+        **{status: Greatest(F(status) + delta, 0)},
+        last_change_at=timezone.now()
+    )
+    if not updated:
+        inbox, created = DoctorInbox.objects.get_or_create(
+            doctor_id=doctor_id,
+            defaults={status: max(delta, 0)}
+        )
+        if not created:
+            # Lost a race with another first write for this doctor
+            adjust_inbox(doctor_id, status, delta)
+
+
+def record_referral_change(old_doctor_id, old_status, new_doctor_id, new_status):
+    """
+    Move one referral between inbox counters. Call inside the same
+    transaction that writes the Client row.
+    """
+    record_referral_changes([(old_doctor_id, old_status, new_doctor_id, new_status)])
+
+
+def record_referral_changes(changes):
+    # Many (old_doctor_id, old_status, new_doctor_id, new_status) moves, one
+    # UPDATE per doctor and status however many referrals there are
+    deltas = Counter()
+    for old_doctor_id, old_status, new_doctor_id, new_status in changes:
+        if (old_doctor_id, old_status) == (new_doctor_id, new_status):
+            continue
+        deltas[old_doctor_id, old_status] -= 1
+        deltas[new_doctor_id, new_status] += 1
+    for (doctor_id, status), delta in deltas.items():
+        if delta:
+            adjust_inbox(doctor_id, status, delta)
+
+
+def pending_count(doctor):
+    # Primary-key lookup on DoctorInbox instead of a COUNT(*) over Client
+    pending = DoctorInbox.objects.filter(doctor_id=doctor.pk).values_list('pending', flat=True).first()
+    return pending or 0
+
+
+async def apending_count(doctor_id):
+    pending = await DoctorInbox.objects.filter(doctor_id=doctor_id).values_list('pending', flat=True).afirst()
+    return pending or 0
+
+
+def reconcile_inboxes(dry_run=False):
+    """
+    Recount every doctor's inbox from Client and repair drifted rows.
+    Returns a list of (doctor_id, stored, actual) tuples that differed.
+    """
+    actual = {
+        row['referred_to']: (row['pending'], row['in_progress'])
+        for row in Client.objects.filter(
+            referred_to__isnull=False,
+            referral_status__in=COUNTED_STATUSES
+        ).order_by().values('referred_to').annotate(
+            pending=Count('id', filter=Q(referral_status='pending')),
+            in_progress=Count('id', filter=Q(referral_status='in_progress')),
+        )
+    }
+    stored = {
+        inbox.doctor_id: (inbox.pending, inbox.in_progress)
+        for inbox in DoctorInbox.objects.all()
+    }
+
+    drift = []
+    for doctor_id in sorted(set(actual) | set(stored)):
+        # A missing row reads as zero, see pending_count()
+        counts = actual.get(doctor_id, (0, 0))
+        if stored.get(doctor_id, (0, 0)) == counts:
+            continue
+        drift.append((doctor_id, stored.get(doctor_id), counts))
+        if not dry_run:
+            DoctorInbox.objects.update_or_create(
+                doctor_id=doctor_id,
+                defaults={'pending': counts[0], 'in_progress': counts[1]}
+            )
+    return drift
@@ -0,0 +1,169 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Job name -> function, called with the job's kwargs. Dotted paths so the
+# modules that enqueue don't import each other through here.
+JOBS = {
+    'rebuild_daily_stats': 'core.daily_stats.rebuild_daily_stats',
+    'reconcile_inboxes': 'core.inbox.reconcile_inboxes',
+    'prune_idempotency_keys': 'core.offline.prune_idempotency_keys',
+}
+
+# SQLite has no row locks: a worker tries this many due jobs before
+# deciding the others got there first
+CLAIM_CANDIDATES = 5
+
+
+def enqueue(name, delay=0, **kwargs):
+    """
+    Queue ``name`` to run with ``kwargs`` (JSON) after ``delay`` seconds.
+    Inside a transaction the job is only visible once it commits, so a
+    worker never starts on data the request might still roll back.
+    """
+    if name not in JOBS:
+        raise ValueError(f"Unknown job: {name}")
+    return Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_once(name, **kwargs):
+    # For housekeeping: skip if the same job is already waiting to run
+    if Job.objects.filter(name=name, kwargs=kwargs, status=Job.QUEUED).exists():
+        return None
+    return enqueue(name, **kwargs)
+
+
+def take(job, worker):
+    # Mark ``job`` running if it's still queued; False if another worker has it
+    now = timezone.now()
+    taken = Job.objects.filter(id=job.id, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+    )
+    if taken:
+        job.status, job.locked_by, job.locked_at, job.attempts = Job.RUNNING, worker, now, job.attempts + 1
+    return bool(taken)
+
+
+def claim(worker):
+    # The oldest due job, now running under ``worker``, or None
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).order_by('run_at', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        # PostgreSQL: FOR UPDATE SKIP LOCKED hands each worker a different row
+        with transaction.atomic():
+            job = due.select_for_update(skip_locked=True).first()
+            if job is not None:
+                take(job, worker)
+            return job
+    for job in due[:CLAIM_CANDIDATES]:
+        if take(job, worker):
+            return job
+    return None
+
+
+def retry_delay(attempts):
+    # Exponential backoff: JOB_RETRY_BACKOFF, then twice that, ... capped
+    return min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+
+
+def run(job):
+    """
+    Run a claimed job. A failure goes back in the queue after
+    retry_delay(), until max_attempts is used up and it's left as failed.
+    """
+    try:
+        import_string(JOBS[job.name])(**job.kwargs)
+    except Exception:
+        logger.exception("job %s #%s failed (attempt %s of %s)", job.name, job.id, job.attempts, job.max_attempts)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status, job.finished_at = Job.FAILED, timezone.now()
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+    else:
+        job.status, job.finished_at = Job.DONE, timezone.now()
+    # Only if it's still ours: past JOB_TIMEOUT requeue_stale() may have
+    # handed it to another worker, whose result wins
+    saved = Job.objects.filter(id=job.id, locked_by=job.locked_by).update(
+        status=job.status, run_at=job.run_at, last_error=job.last_error,
+        finished_at=job.finished_at, locked_by='', locked_at=None,
+    )
+    if not saved:
+        logger.warning("job %s #%s was taken over by another worker; result dropped", job.name, job.id)
+    job.locked_by, job.locked_at = '', None
+    return job.status
+
+
+def requeue_stale():
+    """
+    Jobs whose worker died mid-run (killed deploy, OOM) go back in the
+    queue, or are failed if that was their last attempt, so a job that
+    keeps killing its worker doesn't loop forever. Returns
+    (requeued, failed).
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, locked_by='', locked_at=None,
+        last_error=f"Still running after JOB_TIMEOUT ({settings.JOB_TIMEOUT}s); worker lost",
+    )
+    requeued = stale.update(status=Job.QUEUED, locked_by='', locked_at=None)
+    return requeued, failed
+
+
+def housekeeping():
+    # Run by the worker's main thread every few minutes; survives DB blips
+    close_old_connections()
+    try:
+        return requeue_stale(), prune_jobs()
+    except DatabaseError:
+        logger.exception("job housekeeping failed")
+        connection.close()
+        return (0, 0), 0
+
+
+def prune_jobs():
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    return Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()[0]
+
+
+def work(worker, stop, once=False):
+    """
+    One worker thread: claim and run jobs until ``stop`` (a
+    threading.Event) is set, sleeping JOB_POLL_INTERVAL when the queue is
+    empty. With ``once``, return as soon as nothing is due.
+    """
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                job = claim(worker)
+            except DatabaseError:
+                # Database restarting, or SQLite busy with another writer
+                logger.exception("worker %s couldn't claim a job", worker)
+                connection.close()
+                stop.wait(settings.JOB_POLL_INTERVAL)
+                continue
+            if job is not None:
+                run(job)
+            elif once:
+                return
+            else:
+                stop.wait(settings.JOB_POLL_INTERVAL)
+    finally:
+        connection.close()
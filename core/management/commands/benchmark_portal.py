@@ -0,0 +1,74 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import run_benchmark
+
+SCENARIOS = ['dashboard', 'search', 'check_notifications', 'refer_client', 'client_view']
+
+
+class Command(BaseCommand):
+    help = "Load-test the staff portal views and write latency/query/RSS results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help="Scenario to run (repeatable, default all)")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--base-url', help="Benchmark a running server (e.g. http://127.0.0.1:8000) "
+                                               "instead of the in-process test client")
+        parser.add_argument('--transport', choices=['wsgi', 'asgi'], default='wsgi',
+                            help="In-process request path: sync handler threads or one async event loop")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="wsgi transport: serve with this many threads, like N sync gunicorn workers "
+                                 "(default: one per concurrent client)")
+        parser.add_argument('--db-latency-ms', type=int, default=0,
+                            help="Add this much sleep to every query, to mimic a remote database")
+        parser.add_argument('--server-pid', type=int, help="Report RSS of this server process")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', help="Write JSON results to this file (default stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            results = run_benchmark(
+                options['scenario'] or SCENARIOS,
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                base_url=options['base_url'],
+                server_pid=options['server_pid'],
+                seed=options['seed'],
+                transport=options['transport'],
+                workers=options['workers'],
+                db_latency_ms=options['db_latency_ms'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results['meta']['commit'] = self.git_commit()
+        results['meta']['finished_at'] = datetime.now(timezone.utc).isoformat()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        for name, result in results['scenarios'].items():
+            latency = result['latency_ms']
+            self.stderr.write(
+                f"{name:<20} p50 {latency['p50']:>8}ms  p95 {latency['p95']:>8}ms  "
+                f"p99 {latency['p99']:>8}ms  {result['throughput_rps']:>7} req/s  errors {result['errors']}"
+            )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,36 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.export import CHUNK_SIZE, EXPORT_FORMATS, ExportError, export_lines, export_queryset
+
+
+class Command(BaseCommand):
+    help = "Stream every client (with referral and medical fields) to a gzipped CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Default: clients-<date>.<format>.gz")
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', default=None, help="Created on or after YYYY-MM-DD")
+        parser.add_argument('--to', dest='date_to', default=None, help="Created on or before YYYY-MM-DD")
+        parser.add_argument('--status', default=None, help="Only this referral_status")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_queryset(options['date_from'], options['date_to'], options['status'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        fmt = options['format']
+        output = options['output'] or f"clients-{timezone.localdate():%Y%m%d}.{fmt}.gz"
+        started = time.monotonic()
+        with gzip.open(output, 'wt', encoding='utf-8', newline='') as f:
+            for part in export_lines(rows, fmt, chunk_size=options['chunk_size']):
+                f.write(part)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported clients to {output} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,155 @@
+import csv
+import gzip
+import io
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.daily_stats import record_created
+from core.forms import validate_client_phone
+from core.models import Client, CustomUser, normalize_phone
+
+IMPORT_FIELDS = ['first_name', 'last_name', 'age', 'email', 'phone', 'gender']
+GENDERS = {'m': 'M', 'male': 'M', 'f': 'F', 'female': 'F'}
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path), encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def read_rows(path):
+    # Yields (line_number, dict) one row at a time; the file is never loaded whole
+    name = path[:-3] if path.endswith('.gz') else path
+    with open_text(path) as f:
+        if name.endswith('.jsonl') or name.endswith('.ndjson'):
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield number, {'_raw': line.rstrip('\n'), '_error': f"Invalid JSON: {e}"}
+                    continue
+                yield number, row if isinstance(row, dict) else {'_raw': row, '_error': "Expected an object"}
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k.strip().lower(): v for k, v in row.items() if k}
+
+
+def clean_row(row):
+    """
+    Same rules as ClientForm without building a form: the model field
+    validators plus ClientForm's phone check. Returns (values, errors).
+    """
+    values, errors = {}, {}
+    for name in IMPORT_FIELDS:
+        value = row.get(name)
+        value = '' if value is None else str(value).strip()
+        if name == 'gender':
+            value = GENDERS.get(value.lower(), value)
+        try:
+            if name == 'phone':
+                value = validate_client_phone(value)
+            values[name] = Client._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    return values, errors
+
+
+class Command(BaseCommand):
+    help = "Stream clients from a CSV or JSONL file (optionally .gz) into the database in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or JSONL with one object per line")
+        parser.add_argument('--created-by', required=True, help="Username recorded as the creator")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--rejects', default=None, help="Write rejected rows here as JSONL (default: <path>.rejects.jsonl)")
+        parser.add_argument('--allow-duplicates', action='store_true', help="Import rows whose phone already exists")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only; nothing is written to the database")
+
+    def handle(self, *args, **options):
+        try:
+            created_by = CustomUser.objects.get(username=options['created_by'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user named {options['created_by']!r}")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        path = options['path']
+        rejects_path = options['rejects'] or f"{path}.rejects.jsonl"
+        self.dry_run = options['dry_run']
+        self.allow_duplicates = options['allow_duplicates']
+        self.created_by = created_by
+        self.imported = self.rejected = 0
+        self.seen = set()
+        started = time.monotonic()
+
+        try:
+            with open(rejects_path, 'w', encoding='utf-8') as rejects:
+                self.rejects = rejects
+                batch = []
+                for number, row in read_rows(path):
+                    if '_error' in row:
+                        self.reject(number, row['_raw'], {'row': [row['_error']]})
+                        continue
+                    values, errors = clean_row(row)
+                    if errors:
+                        self.reject(number, row, errors)
+                        continue
+                    batch.append((number, row, values))
+                    if len(batch) >= options['batch_size']:
+                        self.flush(batch)
+                        batch = []
+                self.flush(batch)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        elapsed = time.monotonic() - started
+        verb = "Validated" if self.dry_run else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {self.imported} clients in {elapsed:.1f}s; {self.rejected} rejected"
+            + (f" (see {rejects_path})" if self.rejected else "")
+        ))
+
+    def reject(self, number, row, errors):
+        self.rejected += 1
+        self.rejects.write(json.dumps({'line': number, 'row': row, 'errors': errors}, default=str) + '\n')
+
+    def flush(self, batch):
+        if not batch:
+            return
+
+        # One lookup per batch against the phone_digits index
+        digits = {normalize_phone(values['phone']) for _, _, values in batch}
+        existing = set()
+        if not self.allow_duplicates:
+            existing = set(
+                Client.objects.filter(phone_digits__in=digits).values_list('phone_digits', flat=True)
+            )
+
+        clients = []
+        for number, row, values in batch:
+            phone_digits = normalize_phone(values['phone'])
+            if not self.allow_duplicates:
+                if phone_digits in existing:
+                    self.reject(number, row, {'phone': ["A client with this phone number already exists"]})
+                    continue
+                if phone_digits in self.seen:
+                    self.reject(number, row, {'phone': ["Duplicate phone number earlier in this file"]})
+                    continue
+                self.seen.add(phone_digits)
+            # bulk_create skips Client.save(), so fill phone_digits here
+            clients.append(Client(**values, phone_digits=phone_digits, created_by=self.created_by))
+
+        if clients and not self.dry_run:
+            with transaction.atomic():
+                Client.objects.bulk_create(clients)
+                record_created(clients)
+        self.imported += len(clients)
+        self.stdout.write(f"  {self.imported} imported, {self.rejected} rejected")
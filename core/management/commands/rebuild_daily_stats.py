@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.daily_stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Recount DailyClinicStats from Client and MedicalRecord and repair any drifted days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it")
+
+    def handle(self, *args, **options):
+        drift = rebuild_daily_stats(dry_run=options['dry_run'])
+
+        for day, stored, actual in drift:
+            self.stdout.write(f"{day}: stored {stored} -> actual {actual}")
+
+        verb = "Found" if options['dry_run'] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted day(s)"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.inbox import reconcile_inboxes
+
+
+class Command(BaseCommand):
+    help = "Recount DoctorInbox referral counters from Client and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it")
+
+    def handle(self, *args, **options):
+        drift = reconcile_inboxes(dry_run=options['dry_run'])
+
+        for doctor_id, stored, actual in drift:
+            self.stdout.write(f"doctor {doctor_id}: stored {stored} -> actual {actual}")
+
+        verb = "Found" if options['dry_run'] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted inbox(es)"))
@@ -0,0 +1,53 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.jobs import housekeeping, work
+
+# How often the main thread requeues stale jobs and prunes finished ones
+HOUSEKEEPING_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (core.jobs) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY,
+                            help="Worker threads, each with its own database connection")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if not options['once']:
+            # Render sends SIGTERM on deploys: finish the running jobs, then exit
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *args: stop.set())
+
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        threads = [
+            threading.Thread(target=work, args=(f"{name}:{i}", stop, options['once']), daemon=True)
+            for i in range(max(options['concurrency'], 1))
+        ]
+        self.stdout.write(f"Worker {name} started with {len(threads)} thread(s)")
+        for thread in threads:
+            thread.start()
+
+        last_housekeeping = 0
+        while any(thread.is_alive() for thread in threads):
+            if time.monotonic() - last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                last_housekeeping = time.monotonic()
+                (requeued, failed), pruned = housekeeping()
+                if requeued or failed or pruned:
+                    self.stdout.write(
+                        f"Requeued {requeued} stale job(s), failed {failed}, pruned {pruned} finished"
+                    )
+            for thread in threads:
+                thread.join(timeout=1)
+        connection.close()
+        self.stdout.write(self.style.SUCCESS("Worker stopped"))
@@ -0,0 +1,141 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.daily_stats import record_created
+from core.directory import invalidate_doctor_directory
+from core.inbox import reconcile_inboxes
+from core.models import Client, CustomUser, MedicalRecord, normalize_phone
+
+FIRST_NAMES = [
+    'Abebe', 'Almaz', 'Bekele', 'Birtukan', 'Dawit', 'Eden', 'Fikru', 'Genet',
+    'Hana', 'Kebede', 'Lemlem', 'Mekdes', 'Meron', 'Mulugeta', 'Rahel', 'Selam',
+    'Solomon', 'Tigist', 'Tsion', 'Yonas', 'Yared', 'Zewdu', 'Sara', 'Liya',
+]
+LAST_NAMES = [
+    'Alemu', 'Ayele', 'Bekele', 'Desta', 'Gebre', 'Girma', 'Haile', 'Kassa',
+    'Mengistu', 'Negash', 'Tadesse', 'Tesfaye', 'Wolde', 'Worku', 'Yilma', 'Zeleke',
+]
+DIAGNOSES = ['Acne vulgaris', 'Atopic dermatitis', 'Psoriasis', 'Alopecia areata', 'Melasma', 'Tinea capitis']
+TREATMENTS = ['Topical retinoid nightly', 'Emollients and mild steroid', 'Minoxidil 5%', 'Sun protection, hydroquinone']
+
+# (referral_status, is_referred) -> share of clients
+REFERRAL_MIX = [
+    (('pending', False), 0.55),
+    (('pending', True), 0.15),
+    (('in_progress', True), 0.05),
+    (('completed', True), 0.22),
+    (('cancelled', True), 0.03),
+]
+
+
+@contextmanager
+def historical_timestamps():
+    # bulk_create would stamp every row "now"; let the seed set them
+    fields = [Client._meta.get_field('created_at'), Client._meta.get_field('updated_at')]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, saved):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Bulk-create synthetic doctors, receptionists and clients for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10000)
+        parser.add_argument('--doctors', type=int, default=12)
+        parser.add_argument('--receptionists', type=int, default=6)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=730, help="Spread created_at over this many days")
+        parser.add_argument('--diagnosed', type=float, default=0.4, help="Share of clients with a medical record")
+        parser.add_argument('--password', default='nova-seed', help="Password for every seeded user")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for repeatable data")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        doctors = self.create_users('doctor', options['doctors'], options['password'])
+        receptionists = self.create_users('receptionist', options['receptionists'], options['password'])
+        if not doctors or not receptionists:
+            self.stderr.write("Need at least one doctor and one receptionist")
+            return
+
+        doctor_ids = [u.id for u in doctors]
+        staff_ids = doctor_ids + [u.id for u in receptionists]
+        statuses, weights = zip(*REFERRAL_MIX)
+        now = timezone.now()
+        total, batch_size = options['clients'], options['batch_size']
+
+        created = 0
+        with historical_timestamps():
+            while created < total:
+                size = min(batch_size, total - created)
+                clients = []
+                for _ in range(size):
+                    (status, referred), = rng.choices(statuses, weights)
+                    created_at = now - timedelta(seconds=rng.randint(0, options['days'] * 86400))
+                    phone = f"+2519{rng.randint(0, 99999999):08d}"
+                    clients.append(Client(
+                        first_name=rng.choice(FIRST_NAMES),
+                        last_name=rng.choice(LAST_NAMES),
+                        age=rng.randint(1, 90),
+                        phone=phone,
+                        phone_digits=normalize_phone(phone),
+                        gender=rng.choice('MF'),
+                        created_by_id=rng.choice(staff_ids),
+                        created_at=created_at,
+                        updated_at=created_at,
+                        referred_to_id=rng.choice(doctor_ids) if referred else None,
+                        referral_status=status,
+                        is_referred=referred,
+                        referred_at=created_at if referred else None,
+                        referral_completed_at=created_at if status == 'completed' else None,
+                        has_diagnosis=rng.random() < options['diagnosed'],
+                    ))
+                for client in clients:
+                    client.has_treatment_plan = client.has_diagnosis and rng.random() < 0.7
+
+                with transaction.atomic():
+                    clients = Client.objects.bulk_create(clients)
+                    records = MedicalRecord.objects.bulk_create([
+                        MedicalRecord(
+                            client_id=client.id,
+                            diagnosis=rng.choice(DIAGNOSES),
+                            treatment_plan=rng.choice(TREATMENTS) if client.has_treatment_plan else '',
+                            diagnosed_at=client.created_at,
+                        )
+                        for client in clients if client.has_diagnosis
+                    ])
+                    record_created(clients + records)
+
+                created += size
+                self.stdout.write(f"  {created}/{total} clients")
+
+        drift = reconcile_inboxes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(doctors)} doctors, {len(receptionists)} receptionists, "
+            f"{created} clients; rebuilt {len(drift)} inbox counter(s)"
+        ))
+
+    def create_users(self, user_type, count, password):
+        # Hash once; every seeded user shares the password
+        password = make_password(password)
+        prefix = f"seed_{user_type}_"
+        existing = CustomUser.objects.filter(username__startswith=prefix).count()
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f"{prefix}{i}", user_type=user_type, password=password)
+            for i in range(existing, count)
+        ])
+        # bulk_create sends no post_save, so drop the cached doctor list here
+        invalidate_doctor_directory(CustomUser, None)
+        return list(CustomUser.objects.filter(username__startswith=prefix).order_by('id'))
@@ -0,0 +1,266 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .timing import begin_timing, end_timing
+
+logger = logging.getLogger(__name__)
+
+# Fixed latency buckets in seconds (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'nova_http_requests_total': ('counter', "Requests by route, method and status code"),
+    'nova_http_request_duration_seconds': ('histogram', "Time to build the response, by route"),
+    'nova_db_queries_total': ('counter', "SQL queries run while serving requests, by route"),
+    'nova_db_query_seconds_total': ('counter', "Time spent in SQL while serving requests, by route"),
+    'nova_pending_referral_polls_total': ('counter', "Doctor pending-referral checks by source (poll, stream)"),
+}
+
+
+class Registry:
+    """
+    This worker's metrics. One short lock per update; other workers'
+    numbers come from the snapshot files they flush into METRICS_DIR.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(LATENCY_BUCKETS)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(h)] for (name, labels), h in self.histograms.items()],
+            }
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+# pid + start time, so a reused pid doesn't overwrite a dead worker's totals
+_worker_id = f"{os.getpid()}-{int(time.time())}"
+# Totals of workers that have exited, see retire_worker()
+RETIRED_FILE = 'retired.json'
+
+
+def snapshot_path():
+    return os.path.join(settings.METRICS_DIR, f"worker-{_worker_id}.json")
+
+
+def flush():
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = snapshot_path()
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+
+def start_flusher():
+    """
+    Flush every METRICS_FLUSH_INTERVAL seconds from a daemon thread, so the
+    file writes stay out of requests and off the event loop. Once per
+    process: a worker forked after this ran starts its own.
+    """
+    global _flusher_pid
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=flush_forever, name='metrics-flush', daemon=True).start()
+
+
+def flush_forever():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            logger.exception("metrics flush to %s failed", settings.METRICS_DIR)
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def merge(snapshots):
+    # ({(name, labels): value}, {(name, labels): buckets}) summed over snapshots
+    counters, histograms = defaultdict(float), {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+    return counters, histograms
+
+
+def retire_worker(metrics_dir, pid):
+    """
+    Fold an exited worker's snapshot into retired.json and delete it, so
+    recycled workers (gunicorn max_requests) don't pile up files that every
+    scrape has to read. Called from gunicorn's child_exit hook in the
+    master, the only process that writes retired.json.
+    """
+    paths = glob.glob(os.path.join(metrics_dir, f'worker-{pid}-*.json'))
+    if not paths:
+        return
+    retired_path = os.path.join(metrics_dir, RETIRED_FILE)
+    snapshots = [read_snapshot(path) for path in [retired_path] + paths]
+    counters, histograms = merge(snapshot for snapshot in snapshots if snapshot)
+    tmp = f"{retired_path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+        }, f)
+    os.replace(tmp, retired_path)
+    for path in paths:
+        os.remove(path)
+
+
+def collect():
+    """
+    Sum every worker's snapshot, using live numbers for this one. Counters
+    of workers that have exited stay in (in retired.json), so totals never
+    go backwards.
+    """
+    own = snapshot_path()
+    paths = glob.glob(os.path.join(settings.METRICS_DIR, 'worker-*.json'))
+    paths.append(os.path.join(settings.METRICS_DIR, RETIRED_FILE))
+    snapshots = [registry.snapshot()]
+    snapshots += [read_snapshot(path) for path in paths if path != own]
+    return merge(snapshot for snapshot in snapshots if snapshot)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+
+def format_number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render_metrics():
+    # Prometheus text exposition format 0.0.4
+    counters, histograms = collect()
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), values in histograms.items():
+        by_name[name].append((labels, values))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind != 'histogram':
+                lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_number(value[-2])}")
+            lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Counts every request into the registry under its URL route (not the
+    raw path, so /client/<id>/ stays one series). Outermost middleware,
+    so durations include the rest of the stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        start_flusher()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing, token = begin_timing()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_timing(token)
+        self.record(request, response, timing)
+        return response
+
+    async def __acall__(self, request):
+        timing, token = begin_timing()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_timing(token)
+        self.record(request, response, timing)
+        return response
+
+    def record(self, request, response, timing):
+        match = request.resolver_match
+        route = f"/{match.route}" if match else 'unmatched'
+        inc('nova_http_requests_total', method=request.method, route=route, status=response.status_code)
+        observe('nova_http_request_duration_seconds', time.perf_counter() - timing.started, route=route)
+        if timing.queries:
+            inc('nova_db_queries_total', timing.queries, route=route)
+            inc('nova_db_query_seconds_total', timing.db, route=route)
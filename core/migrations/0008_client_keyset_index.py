@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_remove_client_referral_seen_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='client',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['-created_at', '-id'], name='client_created_id_idx'),
+        ),
+    ]
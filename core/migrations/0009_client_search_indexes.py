@@ -0,0 +1,114 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+# The search index SQL as it stood for this migration, copied rather than
+# imported from core.search so later edits there don't rewrite history
+FTS_TABLE = 'core_client_fts'
+FTS_COLUMNS = ('first_name', 'last_name', 'email')
+
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        first_name, last_name, email,
+        content='core_client', content_rowid='id', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON core_client BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON core_client BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF first_name, last_name, email ON core_client BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO {FTS_TABLE}(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_TRIGRAM_SQL = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f'CREATE INDEX IF NOT EXISTS core_client_{col}_trgm '
+    f'ON core_client USING gin ((UPPER("{col}"::text)) gin_trgm_ops)'
+    for col in FTS_COLUMNS
+]
+
+POSTGRES_TRIGRAM_DROP_SQL = [
+    f'DROP INDEX IF EXISTS core_client_{col}_trgm' for col in FTS_COLUMNS
+]
+
+
+def normalize_phone(phone):
+    digits = ''.join(ch for ch in phone or '' if ch.isdigit())
+    if digits.startswith('251'):
+        return digits[3:]
+    if digits.startswith('0'):
+        return digits[1:]
+    return digits
+
+
+def backfill_phone_digits(apps, schema_editor):
+    Client = apps.get_model('core', 'Client')
+    batch = []
+    for client in Client.objects.only('id', 'phone').order_by('id').iterator(chunk_size=2000):
+        client.phone_digits = normalize_phone(client.phone)
+        batch.append(client)
+        if len(batch) >= 2000:
+            Client.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    if batch:
+        Client.objects.bulk_update(batch, ['phone_digits'])
+
+
+def sqlite_has_fts5(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def run_statements(conn, statements):
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_indexes(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor == 'postgresql':
+        run_statements(conn, POSTGRES_TRIGRAM_SQL)
+    elif conn.vendor == 'sqlite' and sqlite_has_fts5(conn):
+        run_statements(conn, SQLITE_FTS_SQL)
+
+
+def drop_indexes(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor == 'postgresql':
+        run_statements(conn, POSTGRES_TRIGRAM_DROP_SQL)
+    elif conn.vendor == 'sqlite':
+        run_statements(conn, SQLITE_FTS_DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_client_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_phone_digits, migrations.RunPython.noop),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_inboxes(apps, schema_editor):
+    Client = apps.get_model('core', 'Client')
+    DoctorInbox = apps.get_model('core', 'DoctorInbox')
+    rows = Client.objects.filter(
+        referred_to__isnull=False,
+        referral_status__in=('pending', 'in_progress')
+    ).order_by().values('referred_to').annotate(
+        pending=models.Count('id', filter=models.Q(referral_status='pending')),
+        in_progress=models.Count('id', filter=models.Q(referral_status='in_progress')),
+    )
+    DoctorInbox.objects.bulk_create([
+        DoctorInbox(doctor_id=row['referred_to'], pending=row['pending'], in_progress=row['in_progress'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_client_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorInbox',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inbox', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending', models.PositiveIntegerField(default=0)),
+                ('in_progress', models.PositiveIntegerField(default=0)),
+                ('last_change_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_inboxes, migrations.RunPython.noop),
+    ]
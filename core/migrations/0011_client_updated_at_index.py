@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_doctorinbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['updated_at'], name='client_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MEDICAL_FIELDS = ('diagnosis', 'treatment_plan', 'prescriptions', 'doctor_notes', 'referral_notes')
+BATCH_SIZE = 1000
+
+
+def copy_to_records(apps, schema_editor):
+    Client = apps.get_model('core', 'Client')
+    MedicalRecord = apps.get_model('core', 'MedicalRecord')
+
+    def flush(records):
+        MedicalRecord.objects.bulk_create(records)
+        Client.objects.filter(pk__in=[r.client_id for r in records if r.diagnosis]).update(has_diagnosis=True)
+        Client.objects.filter(pk__in=[r.client_id for r in records if r.treatment_plan]).update(has_treatment_plan=True)
+
+    rows = Client.objects.order_by('id').values_list('id', *MEDICAL_FIELDS)
+    batch = []
+    for client_id, *values in rows.iterator(chunk_size=BATCH_SIZE):
+        if not any(values):
+            continue
+        batch.append(MedicalRecord(client_id=client_id, **dict(zip(MEDICAL_FIELDS, values))))
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+def copy_from_records(apps, schema_editor):
+    Client = apps.get_model('core', 'Client')
+    MedicalRecord = apps.get_model('core', 'MedicalRecord')
+
+    batch = []
+    for record in MedicalRecord.objects.order_by('client_id').iterator(chunk_size=BATCH_SIZE):
+        batch.append(Client(id=record.client_id, **{f: getattr(record, f) for f in MEDICAL_FIELDS}))
+        if len(batch) >= BATCH_SIZE:
+            Client.objects.bulk_update(batch, MEDICAL_FIELDS)
+            batch = []
+    if batch:
+        Client.objects.bulk_update(batch, MEDICAL_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_client_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicalRecord',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='medical_record', serialize=False, to='core.client')),
+                ('diagnosis', models.TextField(blank=True)),
+                ('treatment_plan', models.TextField(blank=True)),
+                ('prescriptions', models.TextField(blank=True)),
+                ('doctor_notes', models.TextField(blank=True)),
+                ('referral_notes', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='has_diagnosis',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='has_treatment_plan',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(copy_to_records, copy_from_records),
+        migrations.RemoveField(
+            model_name='client',
+            name='diagnosis',
+        ),
+        migrations.RemoveField(
+            model_name='client',
+            name='doctor_notes',
+        ),
+        migrations.RemoveField(
+            model_name='client',
+            name='prescriptions',
+        ),
+        migrations.RemoveField(
+            model_name='client',
+            name='referral_notes',
+        ),
+        migrations.RemoveField(
+            model_name='client',
+            name='treatment_plan',
+        ),
+    ]
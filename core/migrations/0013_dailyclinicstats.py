@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:50
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    Client = apps.get_model('core', 'Client')
+    MedicalRecord = apps.get_model('core', 'MedicalRecord')
+    DailyClinicStats = apps.get_model('core', 'DailyClinicStats')
+
+    # No record of when old diagnoses were entered; the last edit is the
+    # closest there is
+    MedicalRecord.objects.exclude(diagnosis='').update(diagnosed_at=models.F('updated_at'))
+
+    days = {}
+    for model, field, counter in [
+        (Client, 'created_at', 'new_clients'),
+        (Client, 'referred_at', 'referrals_created'),
+        (Client, 'referral_completed_at', 'referrals_completed'),
+        (MedicalRecord, 'diagnosed_at', 'diagnosed'),
+    ]:
+        rows = model.objects.filter(**{f'{field}__isnull': False}).order_by().annotate(
+            day=TruncDate(field)
+        ).values('day').annotate(count=models.Count('pk'))
+        for row in rows:
+            days.setdefault(row['day'], {})[counter] = row['count']
+    DailyClinicStats.objects.bulk_create([
+        DailyClinicStats(day=day, **counts) for day, counts in days.items()
+    ])
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_medicalrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyClinicStats',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('new_clients', models.PositiveIntegerField(default=0)),
+                ('referrals_created', models.PositiveIntegerField(default=0)),
+                ('referrals_completed', models.PositiveIntegerField(default=0)),
+                ('diagnosed', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='diagnosed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_dailyclinicstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
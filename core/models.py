@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 class CustomUser(AbstractUser):
     USER_TYPE_CHOICES = (
@@ -14,6 +15,16 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.user_type})"
 
+def normalize_phone(phone):
+    # Digits-only national number, so "+251911223344", "0911223344" and
+    # "911 22 33 44" all become "911223344"
+    digits = ''.join(ch for ch in phone or '' if ch.isdigit())
+    if digits.startswith('251'):
+        return digits[3:]
+    if digits.startswith('0'):
+        return digits[1:]
+    return digits
+
 class Client(models.Model):
     GENDER_CHOICES = (
         ('M', 'Male'),
@@ -26,13 +37,13 @@ class Client(models.Model):
     age = models.PositiveIntegerField()
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20)
+    phone_digits = models.CharField(max_length=20, blank=True, editable=False, db_index=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     
-    # Doctor's Notes
-    diagnosis = models.TextField(blank=True)
-    treatment_plan = models.TextField(blank=True)
-    prescriptions = models.TextField(blank=True)
-    doctor_notes = models.TextField(blank=True)
+    # Doctor's notes live on MedicalRecord; these flags keep list views
+    # from having to load the free text
+    has_diagnosis = models.BooleanField(default=False)
+    has_treatment_plan = models.BooleanField(default=False)
     
     # Timestamps
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='clients_created')
@@ -62,15 +73,155 @@ class Client(models.Model):
         default='pending'
     )
     referral_completed_at = models.DateTimeField(null=True, blank=True)
-    referral_notes = models.TextField(blank=True)
     is_referred = models.BooleanField(default=False)
     referred_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
     
+    def save(self, *args, **kwargs):
+        self.phone_digits = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+        super().save(*args, **kwargs)
+    
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
     
+    @property
+    def medical(self):
+        # Loaded on first access only; an unsaved blank record if none exists
+        try:
+            return self.medical_record
+        except MedicalRecord.DoesNotExist:
+            return MedicalRecord(client=self)
+    
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Serves the dashboard's keyset pagination on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='client_created_id_idx'),
+            # Max(updated_at) is the dashboard's change version for ETags
+            models.Index(fields=['updated_at'], name='client_updated_at_idx'),
+        ]
+class MedicalRecord(models.Model):
+    # Bulky free text split off the hot Client row
+    client = models.OneToOneField(
+        Client,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='medical_record'
+    )
+    diagnosis = models.TextField(blank=True)
+    treatment_plan = models.TextField(blank=True)
+    prescriptions = models.TextField(blank=True)
+    doctor_notes = models.TextField(blank=True)
+    referral_notes = models.TextField(blank=True)
+    # When the current diagnosis was first entered; drives the daily stats
+    diagnosed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Medical record for client {self.client_id}"
+    
+    def save(self, *args, **kwargs):
+        if not self.diagnosis:
+            self.diagnosed_at = None
+        elif self.diagnosed_at is None:
+            self.diagnosed_at = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'diagnosis' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'diagnosed_at'}
+        super().save(*args, **kwargs)
+        # Keep the Client flags in step, and bump updated_at so ETags and
+        # cached table rows pick up the change
+        Client.objects.filter(pk=self.client_id).update(
+            has_diagnosis=bool(self.diagnosis),
+            has_treatment_plan=bool(self.treatment_plan),
+            updated_at=timezone.now()
+        )
+
+class DoctorInbox(models.Model):
+    # Denormalized referral counters, kept in step with Client by core.inbox
+    doctor = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='inbox'
+    )
+    pending = models.PositiveIntegerField(default=0)
+    in_progress = models.PositiveIntegerField(default=0)
+    last_change_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.doctor.username}: {self.pending} pending, {self.in_progress} in progress"
+
+class DailyClinicStats(models.Model):
+    # Per-day counts kept by core.daily_stats; each figure counts the
+    # clients whose timestamp falls on that day (in TIME_ZONE)
+    day = models.DateField(primary_key=True)
+    new_clients = models.PositiveIntegerField(default=0)
+    referrals_created = models.PositiveIntegerField(default=0)
+    referrals_completed = models.PositiveIntegerField(default=0)
+    diagnosed = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.day}: {self.new_clients} new, {self.referrals_created} referred"
+
+class ClientTombstone(models.Model):
+    # Deleted client ids for the dashboard change feed (core.changes)
+    client_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"Client {self.client_id} deleted {self.deleted_at}"
+
+class IdempotencyRecord(models.Model):
+    # One applied offline operation (core.offline), so a replayed batch
+    # returns the first result instead of writing twice
+    key = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    operation = models.CharField(max_length=20)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.operation} {self.key}"
+
+class Job(models.Model):
+    # Deferred work for `manage.py run_worker` (core.jobs)
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=50)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest due job: status = queued AND run_at <= now
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .directory import find_doctor
+from .forms import ClientForm
+from .jobs import enqueue_once
+from .models import Client, CustomUser, IdempotencyRecord
+from .referrals import refer
+
+MAX_BATCH = 100
+MAX_KEY_LENGTH = 64
+
+
+class OperationError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def add_client(user, data):
+    # Same validation as the add_client page
+    form = ClientForm(data)
+    if not form.is_valid():
+        raise OperationError({field: list(errors) for field, errors in form.errors.items()})
+    client = form.save(commit=False)
+    client.created_by = user
+    client.save()
+    return {'client_id': client.id}
+
+
+def refer_client(user, data):
+    doctor = find_doctor(data.get('referred_to'))
+    if doctor is None:
+        raise OperationError({'referred_to': ["Doctor not found"]})
+    referred_to = CustomUser(id=doctor.id, username=doctor.username, user_type='doctor')
+    try:
+        refer(data.get('client_id'), referred_to, data.get('notes', ''))
+    except (Client.DoesNotExist, TypeError, ValueError):
+        raise OperationError({'client_id': ["Client not found"]})
+    return {'client_id': int(data['client_id'])}
+
+
+OPERATIONS = {
+    'add_client': add_client,
+    'refer': refer_client,
+}
+
+
+def apply_operation(user, operation):
+    """
+    Apply one queued operation ({'key', 'type', 'data'}) at most once per
+    key. The write and its IdempotencyRecord share a transaction, so two
+    replays racing on a key leave one write and both get its result.
+    """
+    if not isinstance(operation, dict):
+        return {'key': '', 'ok': False, 'errors': {'__all__': ["Bad operation"]}}
+    key = str(operation.get('key') or '')
+    handler = OPERATIONS.get(operation.get('type'))
+    data = operation.get('data') or {}
+    if not key or len(key) > MAX_KEY_LENGTH or handler is None or not isinstance(data, dict):
+        return {'key': key, 'ok': False, 'errors': {'__all__': ["Bad operation"]}}
+
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.filter(key=key).first()
+            if record is None:
+                result = {'ok': True, **handler(user, data)}
+                IdempotencyRecord.objects.create(
+                    key=key, user=user, operation=operation['type'], result=result
+                )
+                return {'key': key, **result}
+    except OperationError as e:
+        # Not recorded: nothing was written
+        return {'key': key, 'ok': False, 'errors': e.errors}
+    except IntegrityError:
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is None:
+            raise
+
+    if record.user_id != user.pk:
+        return {'key': key, 'ok': False, 'errors': {'__all__': ["Key already used"]}}
+    return {'key': key, **record.result, 'duplicate': True}
+
+
+def apply_batch(user, operations):
+    results = [apply_operation(user, operation) for operation in operations]
+    # Old keys are cleared by the worker, off the request
+    enqueue_once('prune_idempotency_keys')
+    return results
+
+
+def prune_idempotency_keys():
+    cutoff = timezone.now() - timedelta(days=settings.IDEMPOTENCY_KEY_RETENTION_DAYS)
+    return IdempotencyRecord.objects.filter(created_at__lt=cutoff).delete()[0]
@@ -0,0 +1,62 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(client):
+    # Cursor is the (created_at, id) of the last row on the page
+    raw = f"{client.created_at.isoformat()}|{client.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, client_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created_at, client_id = datetime.fromisoformat(created_at), int(client_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    if timezone.is_naive(created_at):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return created_at, client_id
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def paginate_clients(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Keyset pagination over Client ordered by (-created_at, -id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+
+    if cursor:
+        created_at, client_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) |
+            Q(created_at=created_at, id__lt=client_id)
+        )
+
+    # Fetch one extra row to know whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+
+    return rows, next_cursor
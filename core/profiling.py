@@ -0,0 +1,219 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+SIGNING_SALT = 'core.profiling'
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+PROFILE_NAME_RE = re.compile(r'^[\w-]+$')
+
+# Set while an async view is being profiled; profile_section() picks it up
+# in the sync_to_async threads that do the actual work
+_session = ContextVar('profile_session', default=None)
+
+
+def make_profile_token(user_id=None):
+    """
+    Signed trigger for ?_profile= / X-Profile. Bound to one user when
+    user_id is given, so a link can be handed to the doctor reporting
+    the slowness without profiling everyone who opens it.
+    """
+    return signing.dumps({'u': user_id}, salt=SIGNING_SALT, compress=True)
+
+
+def token_allows(token, user_id):
+    try:
+        data = signing.loads(token, salt=SIGNING_SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return data.get('u') in (None, user_id)
+
+
+def profile_requested(request):
+    # The common case is two dict misses and a float compare
+    token = request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if token:
+        return token
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def profile_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'profiles')
+
+
+class ProfileSession:
+    def __init__(self, name, request, user):
+        self.name = name
+        self.path = request.get_full_path()
+        self.user = user
+        self.profiles = []
+        self.started = time.perf_counter()
+
+    def run(self, func, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            self.profiles.append(profile)
+
+    def save(self):
+        if not self.profiles:
+            return None
+        wall_ms = (time.perf_counter() - self.started) * 1000
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+
+        stats = pstats.Stats(*self.profiles)
+        base = f"{timezone.now():%Y%m%d-%H%M%S}-{self.name}-{self.user.pk}-{random.randrange(16 ** 4):04x}"
+        stats.dump_stats(os.path.join(directory, base + '.prof'))
+        with open(os.path.join(directory, base + '.json'), 'w') as f:
+            json.dump({
+                'view': self.name,
+                'path': self.path,
+                'user': self.user.get_username(),
+                'wall_ms': round(wall_ms, 2),
+                'profiled_ms': round(stats.total_tt * 1000, 2),
+                'created_at': timezone.now().isoformat(),
+            }, f)
+        prune_profiles()
+        return base
+
+
+def profiled(name):
+    """
+    Profile the view with cProfile when the request carries a valid
+    signed token or falls in PROFILE_SAMPLE_RATE. Sync views are profiled
+    whole. For async views only the profile_section() functions they run
+    count: the event loop thread is shared with other requests.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                requested = profile_requested(request)
+                if not requested:
+                    return await view(request, *args, **kwargs)
+                user = await request.auser()
+                if requested is not True and not token_allows(requested, user.pk):
+                    return await view(request, *args, **kwargs)
+
+                session = ProfileSession(name, request, user)
+                token = _session.set(session)
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    _session.reset(token)
+                response['X-Profile-Id'] = session.save() or ''
+                return response
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                requested = profile_requested(request)
+                if not requested:
+                    return view(request, *args, **kwargs)
+                if requested is not True and not token_allows(requested, request.user.pk):
+                    return view(request, *args, **kwargs)
+
+                session = ProfileSession(name, request, request.user)
+                response = session.run(view, request, *args, **kwargs)
+                response['X-Profile-Id'] = session.save()
+                return response
+        return inner
+    return decorator
+
+
+def profile_section(func):
+    # Sync code an async view runs via sync_to_async; profiled only while
+    # that view's request is being profiled
+    @wraps(func)
+    def inner(*args, **kwargs):
+        session = _session.get()
+        if session is None:
+            return func(*args, **kwargs)
+        return session.run(func, *args, **kwargs)
+    return inner
+
+
+def prune_profiles():
+    # Keep at most PROFILE_MAX_FILES profiles, none older than PROFILE_MAX_AGE_DAYS
+    profiles = list_profiles()
+    cutoff = time.time() - settings.PROFILE_MAX_AGE_DAYS * 86400
+    for i, profile in enumerate(profiles):
+        if i >= settings.PROFILE_MAX_FILES or profile['mtime'] < cutoff:
+            for ext in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(profile_dir(), profile['id'] + ext))
+                except OSError:
+                    pass
+
+
+def list_profiles():
+    """Newest first: the sidecar metadata plus id and mtime."""
+    directory = profile_dir()
+    try:
+        names = [n[:-5] for n in os.listdir(directory) if n.endswith('.json')]
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names:
+        path = os.path.join(directory, name + '.json')
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+            meta.update(id=name, mtime=os.path.getmtime(path))
+        except (OSError, ValueError):
+            continue
+        profiles.append(meta)
+    return sorted(profiles, key=lambda p: p['mtime'], reverse=True)
+
+
+def top_functions(profile_id, sort='cumulative', limit=30):
+    """
+    The top ``limit`` rows of a saved profile as dicts, or None if there
+    is no such profile.
+    """
+    if not PROFILE_NAME_RE.match(profile_id):
+        return None
+    path = os.path.join(profile_dir(), profile_id + '.prof')
+    if not os.path.exists(path):
+        return None
+    if sort not in SORT_KEYS:
+        sort = 'cumulative'
+
+    stats = pstats.Stats(path, stream=io.StringIO())
+    stats.sort_stats(sort)
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        primitive, ncalls, tottime, cumtime, _ = stats.stats[func]
+        filename, line, function = func
+        rows.append({
+            'ncalls': ncalls if ncalls == primitive else f"{ncalls}/{primitive}",
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+            'percall_ms': round(cumtime / primitive * 1000, 3) if primitive else 0,
+            'function': f"{shorten_path(filename)}:{line}({function})",
+        })
+    return rows
+
+
+def shorten_path(filename):
+    # site-packages/django/db/... instead of the full interpreter path
+    for marker in ('site-packages' + os.sep, str(settings.BASE_DIR) + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return filename
@@ -0,0 +1,131 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from .daily_stats import record_updates
+from .events import publish_referral_change
+from .inbox import record_referral_changes
+from .models import Client, MedicalRecord
+
+MAX_BATCH_REFERRALS = 200
+
+# Columns read under the row lock: enough for the inbox counters and the
+# daily stats, none of the client's other fields
+REFERRAL_FIELDS = ('id', 'referred_to_id', 'referral_status', 'is_referred', 'referred_at', 'referral_completed_at')
+
+
+def lock_referrals(client_ids):
+    # {id: row} for the clients that exist, locked until the transaction ends
+    rows = Client.objects.select_for_update().filter(id__in=client_ids).order_by('id').values(*REFERRAL_FIELDS)
+    return {row['id']: row for row in rows}
+
+
+def clean_ids(client_ids):
+    # Ints in request order, duplicates dropped; raises ValueError
+    return list(dict.fromkeys(int(client_id) for client_id in client_ids))
+
+
+def refer_many(client_ids, doctor, notes=''):
+    """
+    Refer every client in ``client_ids`` to ``doctor`` in one transaction
+    and return {client_id: 'referred' | 'not_found'}. Only the referral
+    columns and referral_notes are written, with one UPDATE each, so a
+    doctor saving the medical record at the same time isn't overwritten.
+    """
+    client_ids = clean_ids(client_ids)
+    now = timezone.now()
+    with transaction.atomic():
+        rows = lock_referrals(client_ids)
+        found = list(rows)
+        Client.objects.filter(id__in=found).update(
+            referred_to=doctor,
+            referral_status='pending',
+            is_referred=True,
+            referred_at=now,
+            referral_completed_at=None,
+            updated_at=now,
+        )
+
+        # Most clients already have a record: one UPDATE, and an insert
+        # only when some were missing (existing ones are skipped by the
+        # primary key conflict)
+        with_record = MedicalRecord.objects.filter(client_id__in=found).update(referral_notes=notes, updated_at=now)
+        if with_record < len(found):
+            MedicalRecord.objects.bulk_create([
+                MedicalRecord(client_id=client_id, referral_notes=notes) for client_id in found
+            ], ignore_conflicts=True)
+
+        record_updates(Client, [(
+            {'referred_at': row['referred_at'], 'referral_completed_at': row['referral_completed_at']},
+            {'referred_at': now, 'referral_completed_at': None},
+        ) for row in rows.values()])
+        record_referral_changes([
+            (row['referred_to_id'], row['referral_status'], doctor.id, 'pending') for row in rows.values()
+        ])
+        publish_referral_change(doctor.id, *(row['referred_to_id'] for row in rows.values()))
+    return {client_id: 'referred' if client_id in rows else 'not_found' for client_id in client_ids}
+
+
+def complete_many(client_ids):
+    """
+    Complete the open referrals of ``client_ids`` in one transaction and
+    return {client_id: status}: 'completed', 'already_completed',
+    'not_referred' or 'not_found'. Only open referrals are written.
+    """
+    client_ids = clean_ids(client_ids)
+    now = timezone.now()
+    with transaction.atomic():
+        rows = lock_referrals(client_ids)
+        results = {}
+        for client_id in client_ids:
+            row = rows.get(client_id)
+            if row is None:
+                results[client_id] = 'not_found'
+            elif row['referral_status'] == 'completed':
+                results[client_id] = 'already_completed'
+            elif not row['is_referred']:
+                results[client_id] = 'not_referred'
+            else:
+                results[client_id] = 'completed'
+        completed = [rows[client_id] for client_id, result in results.items() if result == 'completed']
+
+        Client.objects.filter(id__in=[row['id'] for row in completed]).update(
+            referral_status='completed',
+            referral_completed_at=now,
+            updated_at=now,
+        )
+        record_updates(Client, [
+            ({'referral_completed_at': row['referral_completed_at']}, {'referral_completed_at': now})
+            for row in completed
+        ])
+        record_referral_changes([
+            (row['referred_to_id'], row['referral_status'], row['referred_to_id'], 'completed')
+            for row in completed
+        ])
+        publish_referral_change(*(row['referred_to_id'] for row in completed))
+    return results
+
+
+def refer(client_id, doctor, notes=''):
+    """
+    Refer one client to ``doctor``: refer_many() for a single id. Raises
+    Client.DoesNotExist.
+    """
+    if refer_many([client_id], doctor, notes)[int(client_id)] == 'not_found':
+        raise Client.DoesNotExist(f"Client {client_id} not found")
+
+
+def complete(client_id):
+    # 'completed', 'already_completed' or 'not_referred'; raises Client.DoesNotExist
+    result = complete_many([client_id])[int(client_id)]
+    if result == 'not_found':
+        raise Client.DoesNotExist(f"Client {client_id} not found")
+    return result
+
+
+# The async ORM has no transaction.atomic() or select_for_update(), so the
+# async views run the write path above in the request's sync thread
+arefer = sync_to_async(refer)
+acomplete = sync_to_async(complete)
+arefer_many = sync_to_async(refer_many)
+acomplete_many = sync_to_async(complete_many)
@@ -0,0 +1,131 @@
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Set while a view marked @replica_reads runs. A ContextVar so async views
+# and the sync_to_async() calls they make see it, and nothing else does.
+_use_replica = ContextVar('use_replica', default=False)
+
+STICKY_COOKIE = 'nova_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# Only the clinic data is read from the replica. Users, sessions and the
+# idempotency keys stay on the primary: they're cached or checked right
+# after being written, and a lagging copy would stick in the cache.
+REPLICA_MODELS = {'client', 'medicalrecord', 'doctorinbox', 'dailyclinicstats', 'clienttombstone'}
+
+
+def replica_alias():
+    # The replica's DATABASES alias, or None when none is configured
+    alias = settings.REPLICA_DATABASE
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def wrote_recently(request):
+    # The user wrote within REPLICA_STICKY_SECONDS: read their own writes
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def reading_from_replica():
+    return _use_replica.get()
+
+
+def replica_lag():
+    # How far behind the primary the rows being read may be
+    if reading_from_replica():
+        return timedelta(seconds=settings.REPLICA_STICKY_SECONDS)
+    return timedelta(0)
+
+
+def replica_reads(view):
+    """
+    Read the clinic tables from the replica while the view runs, unless
+    there's no replica or the user wrote in the last REPLICA_STICKY_SECONDS.
+    Only for views that don't write.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            token = _use_replica.set(replica_alias() is not None and not wrote_recently(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    else:
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            token = _use_replica.set(replica_alias() is not None and not wrote_recently(request))
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    return inner
+
+
+class ReplicaRouter:
+    # Installed always; without REPLICA_DATABASE it routes nothing
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'core' and model._meta.model_name in REPLICA_MODELS and _use_replica.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both sides
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        if db == replica_alias():
+            return False
+        return None
+
+
+class PrimaryStickyMiddleware:
+    """
+    Stamps a cookie on responses to writes (POST and friends that didn't
+    fail) so the user's next REPLICA_STICKY_SECONDS of reads go to the
+    primary and they see what they just saved.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if replica_alias() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.stamp(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.stamp(request, response)
+        return response
+
+    def stamp(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        sticky = settings.REPLICA_STICKY_SECONDS
+        response.set_cookie(
+            STICKY_COOKIE, f"{time.time() + sticky:.0f}", max_age=sticky,
+            httponly=True, samesite='Lax', secure=request.is_secure(),
+        )
@@ -0,0 +1,73 @@
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Bump when core/client_row.html changes so stale fragments are ignored
+ROW_TEMPLATE_VERSION = 2
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def row_cache_key(client, user_type):
+    # The row shows the creator's and referred doctor's usernames, which
+    # can change without touching the client; callers select_related both
+    created_by = client.created_by.username if client.created_by_id else ''
+    referred_to = client.referred_to.username if client.referred_to_id else ''
+    return f"client_row:{client.id}:{client.updated_at.timestamp()}:{user_type}:{created_by}:{referred_to}"
+
+
+def render_client_rows(clients, user_type):
+    """
+    Render <tr> rows for ``clients``, reusing fragments cached under
+    (id, updated_at, user_type, usernames shown). Misses are rendered and stored in one
+    set_many, so a table costs one get_many plus the misses.
+    """
+    return mark_safe('\n'.join(client_row_fragments(clients, user_type)))
+
+
+def client_row_fragments(clients, user_type):
+    # The rows of render_client_rows() as a list, one string per client
+    clients = list(clients)
+    cache = caches[settings.CLIENT_ROW_CACHE]
+    keys = [row_cache_key(client, user_type) for client in clients]
+    cached = cache.get_many(keys, version=ROW_TEMPLATE_VERSION)
+
+    rows = []
+    missed = {}
+    for key, client in zip(keys, clients):
+        row = cached.get(key)
+        if row is None:
+            row = render_to_string('core/client_row.html', {
+                'client': client,
+                'user_type': user_type
+            })
+            missed[key] = row
+        rows.append(row)
+
+    if missed:
+        cache.set_many(missed, timeout=settings.CLIENT_ROW_CACHE_TIMEOUT, version=ROW_TEMPLATE_VERSION)
+
+    with _lock:
+        _stats['hits'] += len(clients) - len(missed)
+        _stats['misses'] += len(missed)
+
+    return rows
+
+
+def row_cache_stats():
+    # Counters are per worker process
+    with _lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'pid': os.getpid(),
+        'backend': settings.CLIENT_ROW_CACHE,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
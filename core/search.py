@@ -0,0 +1,247 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import normalize_phone
+
+PHONE_QUERY_RE = re.compile(r'[\d\s+()-]*\d[\d\s+()-]*')
+
+FTS_TABLE = 'core_client_fts'
+FTS_COLUMNS = ('first_name', 'last_name', 'email')
+
+# External-content FTS5 table kept in sync with core_client by triggers, so
+# rows written through bulk_create() or QuerySet.update() are indexed too.
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        first_name, last_name, email,
+        content='core_client', content_rowid='id', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON core_client BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON core_client BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF first_name, last_name, email ON core_client BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO {FTS_TABLE}(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# Trigram indexes on the exact expressions Django emits for icontains,
+# i.e. UPPER("col"::text) LIKE UPPER('%q%')
+POSTGRES_TRIGRAM_SQL = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f'CREATE INDEX IF NOT EXISTS core_client_{col}_trgm '
+    f'ON core_client USING gin ((UPPER("{col}"::text)) gin_trgm_ops)'
+    for col in FTS_COLUMNS
+]
+
+POSTGRES_TRIGRAM_DROP_SQL = [
+    f'DROP INDEX IF EXISTS core_client_{col}_trgm' for col in FTS_COLUMNS
+]
+
+
+def sqlite_has_fts5(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_indexes(conn):
+    if conn.vendor == 'postgresql':
+        statements = POSTGRES_TRIGRAM_SQL
+    elif conn.vendor == 'sqlite' and sqlite_has_fts5(conn):
+        statements = SQLITE_FTS_SQL
+    else:
+        return
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def drop_search_indexes(conn):
+    if conn.vendor == 'postgresql':
+        statements = POSTGRES_TRIGRAM_DROP_SQL
+    elif conn.vendor == 'sqlite':
+        statements = SQLITE_FTS_DROP_SQL
+    else:
+        return
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def sqlite_fts_installed(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au']
+        )
+        return cursor.fetchone()[0] == 4
+
+
+def ensure_search_indexes(sender, using='default', **kwargs):
+    # post_migrate hook: SQLite rebuilds core_client on some ALTERs, which
+    # silently drops the FTS triggers, so reinstall them when missing
+    conn = connections[using]
+    _auto_backend.pop(using, None)
+    if conn.vendor != 'sqlite' or 'core_client' not in conn.introspection.table_names():
+        return
+    if sqlite_has_fts5(conn) and not sqlite_fts_installed(conn):
+        create_search_indexes(conn)
+
+
+def phone_prefix(query):
+    # "0911…" and "+2519…" both become the "911…" prefix of phone_digits
+    if not PHONE_QUERY_RE.fullmatch(query):
+        return None
+    digits = normalize_phone(query)
+    raw = ''.join(ch for ch in query if ch.isdigit())
+    if not digits or '251'.startswith(raw):
+        return None
+    return digits
+
+
+class BasicSearch:
+    """Today's icontains search, with a cheap rank and a result cap."""
+
+    name = 'basic'
+
+    def search(self, queryset, query, limit=None):
+        limit = limit or settings.CLIENT_SEARCH_LIMIT
+        query = query.strip()
+        if not query:
+            return []
+
+        prefix = phone_prefix(query)
+        if prefix:
+            return list(self.phone_search(queryset, prefix, limit))
+        return list(self.text_search(queryset, query, limit))
+
+    def phone_search(self, queryset, prefix, limit):
+        # LIKE 'prefix%': PostgreSQL serves it from the varchar_pattern_ops
+        # index Django adds for db_index, whatever the collation
+        return queryset.filter(
+            phone_digits__startswith=prefix
+        ).order_by('phone_digits', '-created_at')[:limit]
+
+    def text_filter(self, query):
+        return (
+            Q(first_name__icontains=query) |
+            Q(last_name__icontains=query) |
+            Q(phone__icontains=query) |
+            Q(email__icontains=query)
+        )
+
+    def text_search(self, queryset, query, limit):
+        rank = Case(
+            When(Q(first_name__iexact=query) | Q(last_name__iexact=query), then=Value(3)),
+            When(Q(first_name__istartswith=query) | Q(last_name__istartswith=query), then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+        return queryset.filter(self.text_filter(query)).annotate(
+            rank=rank
+        ).order_by('-rank', '-created_at', '-id')[:limit]
+
+
+class PostgresTrigramSearch(BasicSearch):
+    """icontains served by the trigram GIN indexes, ranked by similarity."""
+
+    name = 'postgres'
+
+    def text_filter(self, query):
+        # No phone here: an un-indexed column in the OR would force a seq scan,
+        # and digit queries already go through phone_search
+        return (
+            Q(first_name__icontains=query) |
+            Q(last_name__icontains=query) |
+            Q(email__icontains=query)
+        )
+
+    def text_search(self, queryset, query, limit):
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Greatest
+
+        rank = Greatest(*(TrigramSimilarity(col, query) for col in FTS_COLUMNS))
+        return queryset.filter(self.text_filter(query)).annotate(
+            rank=rank
+        ).order_by('-rank', '-created_at', '-id')[:limit]
+
+
+class SQLiteFTSSearch(BasicSearch):
+    """
+    Prefix search against the core_client_fts shadow table, ranked by bm25.
+    FTS only matches the start of words, so when it finds nothing the
+    icontains search runs instead and "ebe" still finds "Kebede".
+    """
+
+    name = 'sqlite_fts'
+
+    def match_expression(self, query):
+        tokens = [t.replace('"', '') for t in query.split()]
+        return ' '.join(f'"{t}"*' for t in tokens if t)
+
+    def text_search(self, queryset, query, limit):
+        match = self.match_expression(query)
+        if not match:
+            return []
+
+        # The ids and the rows must come from the same database (the
+        # replica, under @replica_reads)
+        queryset = queryset.using(queryset.db)
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+                [match, limit]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return list(super().text_search(queryset, query, limit))
+
+        by_id = queryset.in_bulk(ids)
+        return [by_id[i] for i in ids if i in by_id]
+
+
+SEARCH_BACKENDS = {
+    backend.name: backend for backend in (BasicSearch, PostgresTrigramSearch, SQLiteFTSSearch)
+}
+
+
+_auto_backend = {}
+
+
+def detect_search_backend(conn):
+    if conn.vendor == 'postgresql':
+        return 'postgres'
+    if conn.vendor == 'sqlite' and sqlite_fts_installed(conn):
+        return 'sqlite_fts'
+    return 'basic'
+
+
+def get_search_backend(using='default'):
+    name = settings.CLIENT_SEARCH_BACKEND
+    if name == 'auto':
+        # Detected once per process and alias; reset by ensure_search_indexes
+        if using not in _auto_backend:
+            _auto_backend[using] = detect_search_backend(connections[using])
+        name = _auto_backend[using]
+    return SEARCH_BACKENDS[name]()
+
+
+def search_clients(queryset, query, limit=None):
+    return get_search_backend(queryset.db).search(queryset, query, limit)
@@ -0,0 +1,49 @@
+from django.db.models import Count, Q
+
+from .daily_stats import atoday_stats, today_stats
+from .models import Client
+
+
+def stats_aggregates(user):
+    has_diagnosis = Q(has_diagnosis=True)
+    return dict(
+        total_clients=Count('id'),
+        my_patients_count=Count('id', filter=Q(referred_to=user) | has_diagnosis),
+        pending_referrals=Count('id', filter=Q(referred_to=user, referral_status='pending')),
+        completed_treatments=Count('id', filter=has_diagnosis & Q(has_treatment_plan=True)),
+        diagnosed_count=Count('id', filter=has_diagnosis),
+        referred_count=Count('id', filter=Q(is_referred=True)),
+    )
+
+
+def stats_for(user, stats, today):
+    # today is the DailyClinicStats row, so "new today" costs a
+    # primary-key lookup instead of a range count over Client
+    stats['today_count'] = today.new_clients
+    if user.user_type == 'doctor':
+        return {
+            'total_clients': stats['total_clients'],
+            'my_patients_count': stats['my_patients_count'],
+            'pending_referrals': stats['pending_referrals'],
+            'completed_treatments': stats['completed_treatments'],
+            'new_today': stats['today_count'],
+        }
+    return {
+        'total_clients': stats['total_clients'],
+        'diagnosed_count': stats['diagnosed_count'],
+        'today_count': stats['today_count'],
+        'referred_count': stats['referred_count'],
+    }
+
+
+def dashboard_stats(user):
+    """
+    All dashboard figures for ``user`` in one aggregate query, using the
+    has_diagnosis / has_treatment_plan flags kept by MedicalRecord, plus
+    today's DailyClinicStats row.
+    """
+    return stats_for(user, Client.objects.aggregate(**stats_aggregates(user)), today_stats())
+
+
+async def adashboard_stats(user):
+    return stats_for(user, await Client.objects.aaggregate(**stats_aggregates(user)), await atoday_stats())
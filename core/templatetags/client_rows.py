@@ -0,0 +1,10 @@
+from django import template
+
+from core.row_cache import render_client_rows
+
+register = template.Library()
+
+
+@register.simple_tag
+def client_rows(clients, user_type):
+    return render_client_rows(clients, user_type)
@@ -0,0 +1,43 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+# The default cache is file based and shared: cached sessions and users
+# mustn't leak between test runs (ids are reused) or into the dev server
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nova-test',
+    },
+    'client_rows': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nova-test-client-rows',
+    },
+}
+
+
+@override_settings(CACHES=TEST_CACHES, METRICS_ENABLED=False)
+class NovaTestCase(TestCase):
+    """
+    TestCase on private in-memory caches and with metrics off (nothing
+    written to METRICS_DIR), whatever runner starts it.
+    """
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin: assertQueryBudget(budget, func, ...) runs ``func`` and
+    fails with every captured SQL statement if it issues more than
+    ``budget`` queries.
+    """
+
+    def assertQueryBudget(self, budget, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+
+        if len(context) > budget:
+            statements = '\n'.join(
+                f"{i}. {query['sql']}" for i, query in enumerate(context.captured_queries, 1)
+            )
+            self.fail(f"{len(context)} queries exceed the budget of {budget}:\n{statements}")
+        return result
@@ -1,3 +1,1016 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import runpy
+import tempfile
+from datetime import timedelta
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .changes import encode_cursor
+from .conditional import clients_version
+from .daily_stats import daily_stats, rebuild_daily_stats, today_stats
+from .events import referral_stream
+from .directory import doctor_directory, invalidate_doctor_directory
+from .inbox import reconcile_inboxes
+from .jobs import JOBS, claim, enqueue, enqueue_once, requeue_stale, run
+from .models import CustomUser, Client, DailyClinicStats, DoctorInbox, Job, MedicalRecord
+from .search import get_search_backend, phone_prefix, search_clients, sqlite_fts_installed
+from .stats import dashboard_stats
+from .metrics import collect, retire_worker
+from .pagination import paginate_clients
+from .profiling import list_profiles, make_profile_token
+from .referrals import complete, refer
+from .row_cache import client_row_fragments, row_cache_stats
+from .replica import STICKY_COOKIE, PrimaryStickyMiddleware, replica_reads
+from .testing import NovaTestCase, QueryBudgetMixin
+from .timing import install_query_recorder, record_query
+
+
+class DashboardStatsTests(NovaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        cls.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+
+        def client(diagnosis='', treatment_plan='', **kwargs):
+            client = Client.objects.create(
+                first_name='Test', last_name='Client', age=30, phone='+251911223344',
+                gender='F', created_by=cls.receptionist, **kwargs
+            )
+            if diagnosis or treatment_plan:
+                MedicalRecord.objects.create(client=client, diagnosis=diagnosis, treatment_plan=treatment_plan)
+            return client
+
+        client()
+        client(diagnosis='Eczema')
+        client(diagnosis='Acne', treatment_plan='Retinoids')
+        client(referred_to=cls.doctor, referral_status='pending', is_referred=True)
+        client(referred_to=cls.doctor, referral_status='completed', is_referred=True)
+
+    def test_two_queries(self):
+        # One aggregate over Client, one primary-key lookup for today
+        with self.assertNumQueries(2):
+            dashboard_stats(self.doctor)
+
+    def test_doctor_stats(self):
+        self.assertEqual(dashboard_stats(self.doctor), {
+            'total_clients': 5,
+            'my_patients_count': 4,
+            'pending_referrals': 1,
+            'completed_treatments': 1,
+            'new_today': 5,
+        })
+
+    def test_receptionist_stats(self):
+        self.assertEqual(dashboard_stats(self.receptionist), {
+            'total_clients': 5,
+            'diagnosed_count': 2,
+            'today_count': 5,
+            'referred_count': 2,
+        })
+
+    def test_dashboard_query_count(self):
+        self.client.force_login(self.doctor)
+        invalidate_doctor_directory(CustomUser, self.doctor)
+        # user, etag version, doctors, client page, stats, today's stats
+        with self.assertNumQueries(6):
+            self.client.get(reverse('dashboard_view'))
+        # The user and the doctor directory now come from the cache
+        with self.assertNumQueries(4):
+            self.client.get(reverse('dashboard_view'))
+        search = lambda: self.client.get(reverse('dashboard_view'), {'q': 'Test'},
+                                         HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        search()  # warm up the per-process search backend detection
+        # etag version, stats, today's stats, search match, search rows
+        with self.assertNumQueries(5):
+            response = search()
+        self.assertEqual(response.json()['total_count'], 5)
+
+    def test_dashboard_not_modified(self):
+        self.client.force_login(self.doctor)
+        url = reverse('dashboard_view')
+        self.client.get(url)  # sets the CSRF cookie the ETag depends on
+        etag = self.client.get(url)['ETag']
+        # etag version only
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Client.objects.first().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_version_changes_on_delete(self):
+        before = clients_version()
+        # Not the newest: Max(updated_at) alone wouldn't move
+        Client.objects.order_by('updated_at').first().delete()
+        self.assertNotEqual(clients_version(), before)
+        with CaptureQueriesContext(connection) as queries:
+            clients_version()
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+
+
+class KeysetPaginationTests(NovaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        clients = [
+            Client.objects.create(first_name=f'Test{i}', last_name='Client', age=30,
+                                  phone=f'+25191122334{i}', gender='F', created_by=cls.receptionist)
+            for i in range(5)
+        ]
+        # Three clients share a created_at: id breaks the tie
+        same = timezone.now() - timedelta(days=1)
+        Client.objects.filter(id__in=[c.id for c in clients[1:4]]).update(created_at=same)
+        ids = [c.id for c in clients]
+        cls.expected = [ids[4], ids[0], ids[3], ids[2], ids[1]]
+
+    def test_pages_cover_every_client_once(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = paginate_clients(Client.objects.all(), cursor=cursor, page_size=2)
+            seen += [client.id for client in page]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_dashboard_clients_endpoint(self):
+        self.client.force_login(self.receptionist)
+        url = reverse('dashboard_clients')
+        first = self.client.get(url, {'page_size': 2}).json()
+        second = self.client.get(url, {'page_size': 2, 'cursor': first['next_cursor']}).json()
+        self.assertIn(f'data-client-id="{self.expected[2]}"', second['rows_html'])
+        self.assertNotIn(f'data-client-id="{self.expected[1]}"', second['rows_html'])
+
+        naive = base64.urlsafe_b64encode(b'2026-10-18T00:00:00|1').decode()
+        for cursor in ('nope', naive):
+            self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400)
+
+class RowCacheTests(NovaTestCase):
+    def setUp(self):
+        caches[settings.CLIENT_ROW_CACHE].clear()
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        Client.objects.create(first_name='Test', last_name='Client', age=30, phone='+251911223344',
+                              gender='F', created_by=self.receptionist, referred_to=self.doctor, is_referred=True)
+
+    def row(self):
+        client = Client.objects.select_related('created_by', 'referred_to').get()
+        before = row_cache_stats()
+        row, = client_row_fragments([client], 'doctor')
+        return row, row_cache_stats()['hits'] - before['hits']
+
+    def test_hit_then_invalidated_by_changes(self):
+        self.assertEqual(self.row()[1], 0)
+        self.assertEqual(self.row()[1], 1)
+
+        Client.objects.get().save()
+        self.assertEqual(self.row()[1], 0)
+
+        self.doctor.username = 'renamed'
+        self.doctor.save()
+        row, hits = self.row()
+        self.assertEqual(hits, 0)
+        self.assertIn('Dr. renamed', row)
+
+class ClientSearchTests(NovaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        cls.abebe = Client.objects.create(first_name='Abebe', last_name='Kebede', age=30,
+                                          phone='+251911223344', gender='M', created_by=receptionist)
+        cls.almaz = Client.objects.create(first_name='Almaz', last_name='Ayele', age=25,
+                                          phone='0922334455', gender='F', created_by=receptionist)
+
+    def search(self, query):
+        return [client.id for client in search_clients(Client.objects.all(), query)]
+
+    def test_sqlite_fts_with_icontains_fallback(self):
+        if not sqlite_fts_installed(connection):
+            self.skipTest("SQLite built without FTS5")
+        self.assertEqual(get_search_backend().name, 'sqlite_fts')
+        self.assertEqual(self.search('abe'), [self.abebe.id])
+        self.assertEqual(self.search('kebede abe'), [self.abebe.id])
+        # Not a word prefix, so FTS misses it and icontains finds it
+        self.assertEqual(self.search('ebed'), [self.abebe.id])
+        self.assertEqual(self.search('zzz'), [])
+
+    @override_settings(CLIENT_SEARCH_BACKEND='basic')
+    def test_basic_backend(self):
+        self.assertEqual(self.search('ayele'), [self.almaz.id])
+        self.assertEqual(self.search('ebed'), [self.abebe.id])
+
+    def test_phone_forms_normalised(self):
+        self.assertEqual(self.abebe.phone_digits, '911223344')
+        self.assertEqual(self.almaz.phone_digits, '922334455')
+        for query in ('0911 22 33', '+251 911-223', '911223344', '(251) 9112'):
+            self.assertEqual(self.search(query), [self.abebe.id], query)
+        self.assertEqual(self.search('0922'), [self.almaz.id])
+        self.assertIsNone(phone_prefix('25'))
+
+    def test_phone_prefix_matches_longer_numbers(self):
+        receptionist = self.abebe.created_by
+        longer = [
+            Client.objects.create(first_name='Long', last_name=f'Number{i}', age=40,
+                                  phone=f'+251911223344{i}', gender='M', created_by=receptionist)
+            for i in range(3)
+        ]
+        expected = {self.abebe.id, *(client.id for client in longer)}
+        self.assertEqual(set(self.search('0911223')), expected)
+        self.assertEqual(set(self.search('+251911223344')), expected)
+        self.assertEqual(self.search('09112233441'), [longer[1].id])
+
+class DoctorInboxTests(NovaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        cls.other = CustomUser.objects.create_user('doc2', password='pw', user_type='doctor')
+        cls.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+
+    def setUp(self):
+        self.patient = Client.objects.create(
+            first_name='Test', last_name='Client', age=30, phone='+251911223344',
+            gender='F', created_by=self.receptionist
+        )
+
+    def refer(self, doctor):
+        self.client.force_login(self.receptionist)
+        return self.client.post(reverse('refer_client'), {
+            'client_id': self.patient.id, 'referred_to': doctor.id
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def pending(self, doctor):
+        self.client.force_login(doctor)
+        return self.client.get(reverse('check_notifications')).json()['pending_referrals']
+
+    def test_counters_follow_referral_lifecycle(self):
+        self.refer(self.doctor)
+        self.assertEqual(self.pending(self.doctor), 1)
+
+        self.refer(self.other)
+        self.assertEqual(self.pending(self.doctor), 0)
+        self.assertEqual(self.pending(self.other), 1)
+
+        self.client.force_login(self.other)
+        self.client.post(reverse('complete_referral', args=[self.patient.id]),
+                         HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(self.pending(self.other), 0)
+
+    async def test_async_views_under_asgi(self):
+        # Same lifecycle through the ASGI request path the uvicorn worker uses
+        xhr = {'X-Requested-With': 'XMLHttpRequest'}
+        await self.async_client.aforce_login(self.receptionist)
+        response = await self.async_client.post(reverse('refer_client'), {
+            'client_id': self.patient.id, 'referred_to': self.doctor.id
+        }, headers=xhr)
+        self.assertTrue(response.json()['success'])
+
+        await self.async_client.aforce_login(self.doctor)
+        response = await self.async_client.get(reverse('check_notifications'))
+        self.assertEqual(response.json()['pending_referrals'], 1)
+
+        response = await self.async_client.get(reverse('dashboard_view'), {'q': 'Test'}, headers=xhr)
+        self.assertEqual(response.json()['total_count'], 1)
+        self.assertEqual(response.json()['stats']['pending_referrals'], 1)
+
+        response = await self.async_client.post(
+            reverse('complete_referral', args=[self.patient.id]), headers=xhr
+        )
+        self.assertTrue(response.json()['success'])
+        response = await self.async_client.get(reverse('check_notifications'))
+        self.assertEqual(response.json()['pending_referrals'], 0)
+
+    @override_settings(SSE_POLL_INTERVAL=0.01, SSE_MAX_AGE=0.05)
+    async def test_stream_releases_connection_between_ticks(self):
+        calls = []
+
+        async def count(doctor_id):
+            calls.append('read')
+            return 0
+
+        # A connection outside the test's transaction, as in a real request
+        idle = mock.Mock(in_atomic_block=False, close=lambda: calls.append('close'))
+        with mock.patch('core.events.apending_count', count), mock.patch('core.db.connection', idle):
+            async for _ in referral_stream(self.doctor.id):
+                pass
+        self.assertGreater(len(calls), 2)
+        self.assertEqual(calls, ['read', 'close'] * (len(calls) // 2))
+
+    def test_delete_releases_counter(self):
+        self.refer(self.doctor)
+        self.client.force_login(self.doctor)
+        self.client.post(reverse('delete_client', args=[self.patient.id]))
+        self.assertEqual(self.pending(self.doctor), 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.refer(self.doctor)
+        DoctorInbox.objects.filter(doctor=self.doctor).update(pending=7)
+
+        self.assertEqual(reconcile_inboxes(), [(self.doctor.id, (7, 0), (1, 0))])
+        self.assertEqual(reconcile_inboxes(), [])
+        self.assertEqual(self.pending(self.doctor), 1)
+
+
+class DoctorDirectoryTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+
+    def test_user_changes_invalidate(self):
+        self.assertEqual(doctor_directory(), [(self.doctor.id, 'doc')])
+        other = CustomUser.objects.create_user('doc2', password='pw', user_type='doctor')
+        self.assertEqual([d.username for d in doctor_directory()], ['doc', 'doc2'])
+
+        self.client.force_login(self.receptionist)
+        with self.assertNumQueries(0):
+            doctor_directory()
+
+        other.user_type = 'receptionist'
+        other.save()
+        response = self.client.post(reverse('refer_client'), {
+            'client_id': 1, 'referred_to': other.id
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['error'], 'Doctor not found')
+
+        self.doctor.delete()
+        self.assertEqual(doctor_directory(), [])
+
+
+class CachedAuthTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.client.force_login(self.doctor)
+
+    def test_tests_use_a_private_cache(self):
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_polling_skips_auth_queries(self):
+        url = reverse('check_notifications')
+        self.client.get(url)
+        # Only the pending count; session and user come from the cache
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_password_change_logs_out_other_sessions(self):
+        url = reverse('check_notifications')
+        self.client.get(url)
+        self.doctor.set_password('new')
+        self.doctor.save()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_logout(self):
+        url = reverse('check_notifications')
+        self.client.get(url)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_sessions_from_before_the_cached_backend(self):
+        self.client.force_login(self.doctor, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('check_notifications')).status_code, 200)
+
+    def test_wrong_password_checked_once(self):
+        with mock.patch.object(CustomUser, 'check_password', autospec=True, return_value=False) as check:
+            self.assertFalse(self.client.login(username='doc', password='wrong'))
+        self.assertEqual(check.call_count, 1)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.doctor)
+        url = reverse('check_notifications')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class DailyClinicStatsTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        self.patient = Client.objects.create(
+            first_name='Test', last_name='Client', age=30, phone='+251911223344',
+            gender='F', created_by=self.receptionist
+        )
+
+    def counts(self):
+        today = today_stats()
+        return (today.new_clients, today.referrals_created, today.referrals_completed, today.diagnosed)
+
+    def test_signals_track_lifecycle(self):
+        self.assertEqual(self.counts(), (1, 0, 0, 0))
+
+        refer(self.patient.id, self.doctor)
+        complete(self.patient.id)
+        record = MedicalRecord.objects.get(client=self.patient)
+        record.diagnosis = 'Eczema'
+        record.save()
+        self.assertEqual(self.counts(), (1, 1, 1, 1))
+
+        # Editing the notes again doesn't count a second diagnosis
+        record.doctor_notes = 'Follow up'
+        record.save()
+        # Re-referring clears the completion
+        refer(self.patient.id, self.doctor)
+        self.assertEqual(self.counts(), (1, 1, 0, 1))
+        self.assertEqual(rebuild_daily_stats(), [])
+
+        Client.objects.get(id=self.patient.id).delete()
+        self.assertEqual(self.counts(), (0, 0, 0, 0))
+        self.assertEqual(rebuild_daily_stats(), [])
+
+    def test_rebuild_repairs_drift(self):
+        DailyClinicStats.objects.all().delete()
+        drift = rebuild_daily_stats()
+        self.assertEqual(len(drift), 1)
+        self.assertEqual(self.counts(), (1, 0, 0, 0))
+        self.assertEqual([day.new_clients for day in daily_stats(3)], [0, 0, 1])
+
+    def test_seed_keeps_stats(self):
+        call_command('seed_clinic', clients=50, doctors=2, receptionists=1, days=30, seed=1, stdout=StringIO())
+        self.assertEqual(rebuild_daily_stats(dry_run=True), [])
+
+
+class ClientChangesTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        self.patient = Client.objects.create(
+            first_name='Test', last_name='Client', age=30, phone='+251911223344',
+            gender='F', created_by=self.receptionist
+        )
+        self.client.force_login(self.receptionist)
+
+    def changes(self, since):
+        return self.client.get(reverse('client_changes'), {'since': since}).json()
+
+    def test_changes_since_cursor(self):
+        cursor = encode_cursor(self.patient.created_at - timedelta(seconds=1))
+        data = self.changes(cursor)
+        self.assertEqual([row[0] for row in data['changed']], [self.patient.id])
+        self.assertEqual(data['created'], [self.patient.id])
+        self.assertIn(f'data-client-id="{self.patient.id}"', data['changed'][0][1])
+
+        response = self.client.post(reverse('refer_client'), {
+            'client_id': self.patient.id, 'referred_to': self.doctor.id
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+        self.assertIn('Referred to Dr. doc', response['row_html'])
+
+        other = Client.objects.create(
+            first_name='Other', last_name='Client', age=40, phone='+251911223355',
+            gender='M', created_by=self.receptionist
+        )
+        other_id = other.id
+        other.delete()
+        data = self.changes(data['cursor'])
+        self.assertEqual([row[0] for row in data['changed']], [self.patient.id])
+        self.assertIn('Referred to Dr. doc', data['changed'][0][1])
+        self.assertEqual(data['deleted'], [other_id])
+
+    def test_expired_cursor_resets(self):
+        since = encode_cursor(timezone.now() - timedelta(days=30))
+        response = self.client.get(reverse('client_changes'), {'since': since})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['reset'])
+        self.assertEqual(self.client.get(reverse('client_changes'), {'since': 'nope'}).status_code, 400)
+
+        naive = base64.urlsafe_b64encode(b'2026-10-18T00:00:00|0').decode()
+        self.assertEqual(self.client.get(reverse('client_changes'), {'since': naive}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('client_snapshot'), {'since': naive}).status_code, 400)
+
+
+class OfflineBatchTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        self.client.force_login(self.receptionist)
+
+    def batch(self, *operations):
+        return self.client.post(reverse('batch'), json.dumps({'operations': operations}),
+                                content_type='application/json').json()['results']
+
+    def test_replay_is_idempotent(self):
+        add = {'key': 'k1', 'type': 'add_client', 'data': {
+            'first_name': 'Off', 'last_name': 'Line', 'age': 30, 'phone': '+251911223344', 'gender': 'F',
+        }}
+        first, = self.batch(add)
+        self.assertTrue(first['ok'])
+        refer = {'key': 'k2', 'type': 'refer', 'data': {
+            'client_id': first['client_id'], 'referred_to': self.doctor.id, 'notes': 'Rash',
+        }}
+        again, referred, bad = self.batch(add, refer, {'key': 'k3', 'type': 'add_client', 'data': {}})
+
+        self.assertEqual(again, {**first, 'duplicate': True})
+        self.assertTrue(referred['ok'])
+        self.assertFalse(bad['ok'])
+        self.assertIn('phone', bad['errors'])
+        client = Client.objects.get()
+        self.assertEqual((client.created_by, client.referred_to), (self.receptionist, self.doctor))
+
+        self.client.force_login(self.doctor)
+        stolen, = self.batch(add)
+        self.assertFalse(stolen['ok'])
+
+    def test_malformed_operations(self):
+        results = self.batch(1, {'key': 'k1', 'type': 'add_client', 'data': ['x']})
+        self.assertEqual([result['ok'] for result in results], [False, False])
+        self.assertEqual(results[1]['errors'], {'__all__': ["Bad operation"]})
+        self.assertFalse(Client.objects.exists())
+
+    def test_snapshot(self):
+        Client.objects.create(first_name='Test', last_name='Client', age=30, phone='+251911223344',
+                              gender='F', created_by=self.receptionist)
+        data = self.client.get(reverse('client_snapshot')).json()
+        self.assertEqual(len(data['rows']), 1)
+        self.assertEqual(dict(zip(data['fields'], data['rows'][0]))['first_name'], 'Test')
+        self.assertFalse(data['more'])
+
+
+class BatchReferralTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user('doc', password='pw', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        self.clients = [
+            Client.objects.create(first_name=f'Test{i}', last_name='Client', age=30, phone=f'+25191122334{i}',
+                                  gender='F', created_by=self.receptionist)
+            for i in range(3)
+        ]
+        self.ids = [client.id for client in self.clients]
+
+    def post(self, user, name, body):
+        self.client.force_login(user)
+        return self.client.post(reverse(name), json.dumps(body), content_type='application/json')
+
+    def statuses(self, response):
+        return {result['client_id']: result['status'] for result in response.json()['results']}
+
+    def test_refer_and_complete_batches(self):
+        MedicalRecord.objects.create(client=self.clients[0], diagnosis='Eczema')
+        response = self.post(self.receptionist, 'refer_clients_batch', {
+            'client_ids': self.ids[:2] + [999], 'referred_to': self.doctor.id, 'notes': 'Intake',
+        })
+        self.assertEqual(self.statuses(response), {self.ids[0]: 'referred', self.ids[1]: 'referred', 999: 'not_found'})
+        self.assertEqual(MedicalRecord.objects.filter(referral_notes='Intake').count(), 2)
+        self.assertEqual(MedicalRecord.objects.get(client=self.clients[0]).diagnosis, 'Eczema')
+        self.assertEqual(DoctorInbox.objects.get(doctor=self.doctor).pending, 2)
+        self.assertEqual(today_stats().referrals_created, 2)
+
+        Client.objects.filter(id=self.ids[1]).update(referral_status='completed')
+        response = self.post(self.doctor, 'complete_referrals_batch', {'client_ids': self.ids})
+        self.assertEqual(self.statuses(response), {
+            self.ids[0]: 'completed', self.ids[1]: 'already_completed', self.ids[2]: 'not_referred',
+        })
+        self.assertEqual(Client.objects.filter(referral_status='completed').count(), 2)
+
+    def test_rejects_bad_batches(self):
+        self.assertEqual(self.post(self.receptionist, 'refer_clients_batch', {
+            'client_ids': self.ids, 'referred_to': self.receptionist.id,
+        }).status_code, 400)
+        self.assertEqual(self.post(self.receptionist, 'refer_clients_batch', {
+            'client_ids': [], 'referred_to': self.doctor.id,
+        }).status_code, 400)
+        self.assertEqual(self.post(self.receptionist, 'complete_referrals_batch', {
+            'client_ids': self.ids,
+        }).status_code, 403)
+
+class ReplicaRoutingTests(NovaTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+        @replica_reads
+        def view(request):
+            return HttpResponse(f"{router.db_for_read(Client)} {router.db_for_read(CustomUser)}")
+        self.view = view
+
+    def test_without_replica_everything_stays_on_default(self):
+        self.assertEqual(self.view(self.factory.get('/')).content, b'default default')
+        with self.assertRaises(MiddlewareNotUsed):
+            PrimaryStickyMiddleware(self.view)
+
+    @mock.patch('core.replica.replica_alias', return_value='replica')
+    def test_reads_stick_to_primary_after_a_write(self, replica_alias):
+        self.assertEqual(self.view(self.factory.get('/')).content, b'replica default')
+        self.assertEqual(router.db_for_read(Client), 'default')
+        self.assertEqual(router.db_for_write(Client), 'default')
+
+        post = PrimaryStickyMiddleware(lambda request: HttpResponse())(self.factory.post('/'))
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = post.cookies[STICKY_COOKIE].value
+        self.assertEqual(self.view(request).content, b'default default')
+
+def failing_job():
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(NovaTestCase):
+    def test_run_and_dedupe(self):
+        job = enqueue_once('prune_idempotency_keys')
+        self.assertIsNone(enqueue_once('prune_idempotency_keys'))
+        self.assertEqual(claim('w1'), job)
+        self.assertIsNone(claim('w2'))
+        self.assertEqual(run(job), Job.DONE)
+        self.assertEqual(Job.objects.get().attempts, 1)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=10)
+    @mock.patch.dict(JOBS, {'failing': 'core.tests.failing_job'})
+    def test_retries_with_backoff_then_fails(self):
+        enqueue('failing')
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(run(claim('w1')), Job.QUEUED)
+        job = Job.objects.get()
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertIsNone(claim('w1'))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(run(claim('w1')), Job.FAILED)
+
+    @override_settings(JOB_TIMEOUT=60, JOB_MAX_ATTEMPTS=2)
+    def test_stale_jobs_requeued_then_failed(self):
+        job = enqueue('prune_idempotency_keys')
+        lost = claim('w1')
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale(), (1, 0))
+
+        # The slow first run finishing late doesn't overwrite the second
+        claim('w2')
+        with self.assertLogs('core.jobs', 'WARNING'):
+            run(lost)
+        self.assertEqual(Job.objects.get().locked_by, 'w2')
+
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_staff_enqueue(self):
+        staff = CustomUser.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post(reverse('enqueue_job', args=['reconcile_inboxes']))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Job.objects.get().name, 'reconcile_inboxes')
+        self.assertEqual(self.client.post(reverse('enqueue_job', args=['nope'])).status_code, 404)
+
+    def test_deferred_work_is_queued(self):
+        receptionist = CustomUser.objects.create_user('rec', password='pw', user_type='receptionist')
+        patient = Client.objects.create(first_name='Test', last_name='Client', age=30,
+                                        phone='+251911223344', gender='F', created_by=receptionist)
+        # A stats timestamp that wasn't loaded can't be moved between days
+        partial = Client.objects.only('id').get(id=patient.id)
+        partial.referred_at = timezone.now()
+        partial.save()
+        self.assertEqual(list(Job.objects.values_list('name', flat=True)), ['rebuild_daily_stats'])
+
+        admin = CustomUser.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:core_client_delete', args=[patient.id]), {'post': 'yes'})
+        self.assertFalse(Client.objects.exists())
+        self.assertEqual(Job.objects.filter(name='reconcile_inboxes').count(), 1)
+
+class ImportClientsTests(NovaTestCase):
+    def setUp(self):
+        self.receptionist = CustomUser.objects.create_user(
+            username='reception', password='x', user_type='receptionist'
+        )
+        Client.objects.create(
+            first_name='Old', last_name='Client', age=40, phone='+251911000001',
+            gender='F', created_by=self.receptionist
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_import_csv_with_rejects(self):
+        path = os.path.join(self.tmp.name, 'clients.csv')
+        with open(path, 'w') as f:
+            f.write("first_name,last_name,age,email,phone,gender\n")
+            f.write("Abebe,Kebede,30,,+251911000002,M\n")
+            f.write("Bad,Phone,30,,0911000003,M\n")         # fails ClientForm's phone rule
+            f.write("Dup,InDb,30,,+251911000001,F\n")       # already in the table
+            f.write("Dup,InFile,30,,+251911000002,F\n")     # repeats line 2
+            f.write("Selam,Haile,25,s@example.com,+251911000004,female\n")
+
+        call_command('import_clients', path, created_by='reception', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            set(Client.objects.values_list('first_name', 'phone_digits')),
+            {('Old', '911000001'), ('Abebe', '911000002'), ('Selam', '911000004')}
+        )
+        with open(path + '.rejects.jsonl') as f:
+            rejects = [json.loads(line) for line in f]
+        self.assertEqual([r['line'] for r in rejects], [3, 4, 5])
+        self.assertIn('phone', rejects[0]['errors'])
+
+
+class ExportClientsTests(NovaTestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='doc', password='x', user_type='doctor')
+        self.receptionist = CustomUser.objects.create_user(
+            username='reception', password='x', user_type='receptionist'
+        )
+        for i, status in enumerate(['pending', 'completed', 'completed']):
+            client = Client.objects.create(
+                first_name=f'Client{i}', last_name='Test', age=30, phone=f'+25191100000{i}',
+                gender='F', created_by=self.receptionist, referral_status=status
+            )
+            MedicalRecord.objects.create(client=client, diagnosis=f'Diagnosis, line {i}\nsecond line')
+
+    def test_doctor_streams_filtered_csv(self):
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('export_clients'), {'status': 'completed'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['first_name'] for row in rows], ['Client1', 'Client2'])
+        self.assertEqual(rows[0]['diagnosis'], 'Diagnosis, line 1\nsecond line')
+
+    def test_csv_formulas_neutralised(self):
+        Client.objects.create(first_name='=HYPERLINK("http://x")', last_name='@SUM(A1)', age=30,
+                              phone='+251911000009', gender='F', created_by=self.receptionist)
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('export_clients'))
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[-1]['first_name'], '\'=HYPERLINK("http://x")')
+        self.assertEqual(rows[-1]['last_name'], "'@SUM(A1)")
+        self.assertEqual(rows[-1]['phone'], '+251911000009')
+        self.assertEqual(rows[0]['first_name'], 'Client0')
+
+        # JSON Lines isn't opened by spreadsheets: values stay as stored
+        response = self.client.get(reverse('export_clients'), {'format': 'jsonl'})
+        last = json.loads(b''.join(response.streaming_content).decode().splitlines()[-1])
+        self.assertEqual(last['first_name'], '=HYPERLINK("http://x")')
+
+    def test_bad_filter_and_receptionist(self):
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('export_clients'), {'from': '31/01/2025'}).status_code, 400)
+
+        self.client.force_login(self.receptionist)
+        self.assertEqual(self.client.get(reverse('export_clients')).status_code, 302)
+
+
+class DatabaseSettingsTests(NovaTestCase):
+    def load_settings(self, **env):
+        # Evaluate nova/settings.py again under ``env``
+        with mock.patch.dict(os.environ, env), redirect_stdout(StringIO()):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'nova', 'settings.py'))
+
+    def test_database_url_with_pool(self):
+        loaded = self.load_settings(
+            DATABASE_URL='postgres://nova:pw@db.example.com:5432/nova', DB_POOL_MODE='pool',
+            DB_POOL_MIN_SIZE='2', DB_POOL_MAX_SIZE='6', DB_STATEMENT_TIMEOUT_MS='5000',
+        )
+        default = loaded['DATABASES']['default']
+        self.assertEqual(default['HOST'], 'db.example.com')
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertEqual(default['OPTIONS']['pool'], {
+            'min_size': 2, 'max_size': 6, 'timeout': 10.0, 'max_idle': 300.0, 'max_lifetime': 1800.0,
+        })
+        self.assertEqual(default['OPTIONS']['options'], '-c statement_timeout=5000')
+
+    def test_persistent_mode_has_no_pool(self):
+        loaded = self.load_settings(DATABASE_URL='postgres://nova:pw@db.example.com:5432/nova',
+                                    DB_POOL_MODE='persistent')
+        default = loaded['DATABASES']['default']
+        self.assertNotIn('pool', default['OPTIONS'])
+        self.assertEqual(default['CONN_MAX_AGE'], 600)
+        self.assertTrue(default['CONN_HEALTH_CHECKS'])
+
+@override_settings(SERVER_TIMING=True, SERVER_TIMING_SAMPLE_RATE=1.0)
+class ServerTimingTests(NovaTestCase):
+    def setUp(self):
+        # apps.ready() only hooks new connections when SERVER_TIMING is on at startup
+        install_query_recorder(None, connection)
+        self.addCleanup(connection.execute_wrappers.remove, record_query)
+        self.doctor = CustomUser.objects.create_user(username='doc', password='x', user_type='doctor')
+
+    def test_header_and_log_line(self):
+        self.client.force_login(self.doctor)
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(reverse('check_notifications'))
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'check_notifications')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], QUERY_BUDGETS['check_notifications'])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_untouched(self):
+        self.client.force_login(self.doctor)
+        response = self.client.get(reverse('check_notifications'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(NovaTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(METRICS_ENABLED=True, METRICS_DIR=tmp.name, METRICS_TOKEN='scrape-me')
+        override.enable()
+        self.addCleanup(override.disable)
+        flusher = mock.patch('core.metrics.start_flusher')
+        self.start_flusher = flusher.start()
+        self.addCleanup(flusher.stop)
+        self.doctor = CustomUser.objects.create_user(username='doc', password='x', user_type='doctor')
+
+    def test_requests_dont_write_snapshots(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('check_notifications'))
+        # The background flusher writes; the request itself touches no file
+        self.start_flusher.assert_called()
+        self.assertEqual(os.listdir(settings.METRICS_DIR), [])
+
+    def test_prometheus_text(self):
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('check_notifications'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE nova_http_request_duration_seconds histogram', body)
+        self.assertIn('nova_http_requests_total{method="GET",route="/check-notifications/",status="200"}', body)
+        self.assertIn('nova_http_request_duration_seconds_bucket{route="/check-notifications/",le="+Inf"}', body)
+        self.assertIn('nova_pending_referral_polls_total{source="poll"}', body)
+
+    def test_exited_workers_folded_into_one_file(self):
+        snapshot = {'counters': [['nova_test_total', [], 2]], 'histograms': []}
+        for name in ('worker-111-1.json', 'worker-111-2.json', 'worker-222-1.json'):
+            with open(os.path.join(settings.METRICS_DIR, name), 'w') as f:
+                json.dump(snapshot, f)
+
+        retire_worker(settings.METRICS_DIR, 111)
+        retire_worker(settings.METRICS_DIR, 222)
+        self.assertEqual(os.listdir(settings.METRICS_DIR), ['retired.json'])
+        counters, _ = collect()
+        self.assertEqual(counters['nova_test_total', ()], 6)
+
+
+class ProfilingTests(NovaTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.doctor = CustomUser.objects.create_user(username='doc', password='x', user_type='doctor', is_staff=True)
+        self.other = CustomUser.objects.create_user(username='doc2', password='x', user_type='doctor')
+        self.patient = Client.objects.create(
+            first_name='Test', last_name='Client', age=30, phone='+251911223344',
+            gender='F', created_by=self.doctor
+        )
+        self.client.force_login(self.doctor)
+
+    def test_signed_token_profiles_request(self):
+        url = reverse('client_view', args=[self.patient.id])
+        self.assertNotIn('X-Profile-Id', self.client.get(url))
+        self.assertNotIn('X-Profile-Id', self.client.get(url, {'_profile': 'forged'}))
+        self.assertNotIn('X-Profile-Id', self.client.get(url, headers={'X-Profile': make_profile_token(self.other.pk)}))
+
+        response = self.client.get(url, headers={'X-Profile': make_profile_token(self.doctor.pk)})
+        profile_id = response['X-Profile-Id']
+        self.assertEqual([p['id'] for p in list_profiles()], [profile_id])
+
+        response = self.client.get(reverse('profile_detail', args=[profile_id]), {'sort': 'tottime'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['rows'])
+
+    @override_settings(PROFILE_MAX_FILES=2)
+    def test_retention(self):
+        token = make_profile_token()
+        for _ in range(4):
+            self.client.get(reverse('client_view', args=[self.patient.id]), {'_profile': token})
+        self.assertEqual(len(list_profiles()), 2)
+
+    @override_settings(PROFILE_TOKEN_MAX_AGE=2 * 3600)
+    def test_profiles_page_shows_token_lifetime(self):
+        self.assertContains(self.client.get(reverse('profiles')), 'Valid for 2\xa0hours.')
+
+
+# Declared per-view query budgets; they must not grow with the client table
+# First request after a login: the session comes from the cache, the user
+# from the database (logging in saves the user, which drops its cache entry).
+# A referral write is the user, a savepoint pair, the row lock, the client
+# UPDATE, one UPDATE each for the medical record (refer only), today's
+# stats and the doctor's inbox, then the re-read of the client's row.
+QUERY_BUDGETS = {
+    'dashboard': 6,
+    'dashboard_search': 6,
+    'pending_referrals_view': 3,
+    'client_view': 3,
+    'edit_client_medical': 3,
+    'refer_client': 9,
+    'complete_referral': 8,
+    'check_notifications': 2,
+}
+
+
+class QueryBudgetTests(QueryBudgetMixin, NovaTestCase):
+    client_count = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_clinic', clients=cls.client_count, doctors=3, receptionists=2,
+                     seed=1, stdout=StringIO())
+        cls.doctor = CustomUser.objects.filter(user_type='doctor').first()
+        cls.receptionist = CustomUser.objects.filter(user_type='receptionist').first()
+        cls.patient = Client.objects.filter(has_diagnosis=True).first()
+        # Make sure the doctor has pending referrals to render
+        Client.objects.filter(id__in=Client.objects.values('id')[:5]).update(
+            referred_to=cls.doctor, referral_status='pending', is_referred=True, referral_completed_at=None
+        )
+        cls.referred = Client.objects.filter(referred_to=cls.doctor).first()
+        # A client being referred for the first time, with a medical record
+        cls.unreferred = Client.objects.filter(has_diagnosis=True).exclude(referred_to=cls.doctor).first()
+        Client.objects.filter(id=cls.unreferred.id).update(
+            referred_to=None, referral_status='pending', is_referred=False, referred_at=None
+        )
+        reconcile_inboxes()
+        # Steady state: today's stats row exists after the day's first write
+        DailyClinicStats.objects.get_or_create(day=timezone.localdate())
+
+    def setUp(self):
+        # Warm per-process caches so only steady-state queries are counted
+        self.client.force_login(self.doctor)
+        self.client.get(reverse('dashboard_view'), {'q': 'abe'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def as_user(self, user):
+        self.client.force_login(user)
+        # Logging in saves the user, which drops the cached doctor directory
+        doctor_directory()
+        return self.client
+
+    def test_dashboard(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['dashboard'], self.as_user(self.doctor).get, reverse('dashboard_view')
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_search(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['dashboard_search'], self.as_user(self.receptionist).get,
+            reverse('dashboard_view'), {'q': 'abe'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_pending_referrals_view(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['pending_referrals_view'], self.as_user(self.doctor).get,
+            reverse('pending_referrals_view')
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_client_view(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['client_view'], self.as_user(self.doctor).get,
+            reverse('client_view', args=[self.patient.id])
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_edit_client_medical(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['edit_client_medical'], self.as_user(self.doctor).get,
+            reverse('edit_client_medical', args=[self.patient.id])
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_refer_client(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['refer_client'], self.as_user(self.receptionist).post,
+            reverse('refer_client'), {'client_id': self.unreferred.id, 'referred_to': self.doctor.id},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertTrue(response.json()['success'])
+
+    def test_complete_referral(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['complete_referral'], self.as_user(self.doctor).post,
+            reverse('complete_referral', args=[self.referred.id]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertTrue(response.json()['success'])
+
+    def test_check_notifications(self):
+        response = self.assertQueryBudget(
+            QUERY_BUDGETS['check_notifications'], self.as_user(self.doctor).get,
+            reverse('check_notifications')
+        )
+        self.assertGreater(response.json()['pending_referrals'], 0)
+
+
+class LargeTableQueryBudgetTests(QueryBudgetTests):
+    # Same budgets at 1000x the rows: query counts are O(1) in table size
+    client_count = 10000
@@ -0,0 +1,169 @@
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+# The timing of the request being served. A ContextVar rather than a
+# thread-local so queries and renders in sync_to_async threads of an async
+# view still land on their request.
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    __slots__ = ('started', 'queries', 'db', 'template', 'template_depth')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.template_depth = 0
+
+
+def begin_timing():
+    # Reuse the request's timing if an outer middleware already started one
+    timing = _current.get()
+    if timing is not None:
+        return timing, None
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def end_timing(token):
+    if token is not None:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.queries += 1
+        timing.db += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created receiver. Same hook as connection.execute_wrapper(),
+    # but installed on every connection (each thread has its own) instead of
+    # only the one the middleware runs on. Outermost, so it also sees
+    # DB_SIMULATED_LATENCY_MS.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return super().render(context, request)
+        # Only the outermost render counts; client_rows renders rows inside
+        # the table template
+        timing.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_depth -= 1
+            if not timing.template_depth:
+                timing.template += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report render time to ServerTimingMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ServerTimingMiddleware:
+    """
+    Per-request SQL count/time, template time and total time as a
+    Server-Timing header (browser devtools, Network > Timing) and one JSON
+    log line on the core.timing logger. Only SERVER_TIMING_SAMPLE_RATE of
+    requests are timed. With SERVER_TIMING off the middleware removes
+    itself at startup.
+
+    Streaming responses are timed up to the first byte only.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timing, token = begin_timing()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_timing(token)
+        self.report(request, response, timing)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timing, token = begin_timing()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_timing(token)
+        self.report(request, response, timing)
+        return response
+
+    def report(self, request, response, timing):
+        total = (time.perf_counter() - timing.started) * 1000
+        db, template = timing.db * 1000, timing.template * 1000
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db:.1f};desc="{timing.queries} queries"',
+            f'tpl;dur={template:.1f};desc="templates"',
+            f'app;dur={max(total - db - template, 0):.1f};desc="python"',
+            f'total;dur={total:.1f}',
+        ])
+        match = request.resolver_match
+        logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': timing.queries,
+            'db_ms': round(db, 2),
+            'template_ms': round(template, 2),
+            'total_ms': round(total, 2),
+        }))
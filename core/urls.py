@@ -16,20 +16,35 @@ urlpatterns = [
     
     # Dashboard
     path('dashboard/', views.dashboard, name='dashboard_view'),
+    path('dashboard/clients/', views.dashboard_clients, name='dashboard_clients'),
+    path('api/clients/changes', views.client_changes_view, name='client_changes'),
+    path('api/clients/snapshot', views.client_snapshot_view, name='client_snapshot'),
+    path('api/batch', views.batch_view, name='batch'),
     
     # Client management
     path('client/add/', views.add_client, name='add_client_view'),
     path('client/<int:client_id>/view/', views.client_view, name='client_view'),
     path('client/<int:client_id>/edit-medical/', views.edit_client_medical, name='edit_client_medical'),
+    path('clients/export/', views.export_clients, name='export_clients'),
     
     # Referrals
     path('refer-client/', views.refer_client, name='refer_client'),
     path('complete-referral/<int:client_id>/', views.complete_referral, name='complete_referral'),
     path('client/<int:client_id>/complete-referral/', views.complete_referral, name='complete_referral'),
+    path('referrals/batch/refer/', views.refer_clients_batch, name='refer_clients_batch'),
+    path('referrals/batch/complete/', views.complete_referrals_batch, name='complete_referrals_batch'),
     path('pending-referrals/', views.pending_referrals_view, name='pending_referrals_view'),
     path('mark-referral-seen/<int:client_id>/', views.mark_referral_seen, name='mark_referral_seen'),
     
     # Notifications
     path('check-notifications/', views.check_notifications, name='check_notifications'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     path('client/<int:client_id>/delete/', views.delete_client, name='delete_client'),
+    
+    # Diagnostics
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('jobs/<str:name>/', views.enqueue_job, name='enqueue_job'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('profiles/', views.profiles_view, name='profiles'),
+    path('profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
 ]
\ No newline at end of file
@@ -1,11 +1,40 @@
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .forms import CustomUserCreationForm, ClientForm, MedicalEditForm
 from .models import CustomUser, Client
+from .changes import InvalidCursor as InvalidChangesCursor, client_changes, current_cursor
+from .conditional import acondition, adashboard_etag, client_etag, dashboard_etag, pending_referrals_etag
+from .db import pool_stats
+from .directory import afind_doctor, doctor_directory
+from .events import publish_referral_change, referral_stream
+from .export import EXPORT_FORMATS, ExportError, aiterate, export_lines, export_queryset
+from .jobs import JOBS, enqueue
+from .inbox import apending_count, record_referral_change
+from . import metrics
+from .metrics import render_metrics
+from .offline import MAX_BATCH, apply_batch
+from .pagination import InvalidCursor, get_page_size, paginate_clients
+from .profiling import SORT_KEYS, list_profiles, make_profile_token, profile_section, profiled, top_functions
+from .row_cache import client_row_fragments, render_client_rows, row_cache_stats
+from .replica import replica_reads
+from .referrals import MAX_BATCH_REFERRALS, acomplete, acomplete_many, arefer, arefer_many
+from .search import search_clients
+from .stats import adashboard_stats, dashboard_stats
 from django.template.loader import render_to_string
-from django.db.models import Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.utils.timesince import timesince
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, conditional_page, require_POST
+from django.views.decorators.vary import vary_on_headers
 
 def is_doctor(user):
     return user.is_authenticated and (user.user_type == 'doctor' or user.is_superuser)
@@ -14,21 +43,18 @@ def is_receptionist(user):
     return user.is_authenticated and user.user_type == 'receptionist'
 
 @login_required
+@profiled('client_view')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=client_etag)
 def client_view(request, client_id):
-    client = get_object_or_404(Client, id=client_id)
-    
-    return render(request, 'core/client.html', {
-        'client': client,
-        'user_type': request.user.user_type
-    })
-
-    
-    # Check if user has permission to view this client
-    if request.user.user_type == 'receptionist' and client.created_by != request.user:
-        return redirect('dashboard_view')
+    client = get_object_or_404(
+        Client.objects.select_related('created_by', 'referred_to', 'medical_record'),
+        id=client_id
+    )
     
     return render(request, 'core/client.html', {
         'client': client,
+        'medical': client.medical,
         'user_type': request.user.user_type
     })
 
@@ -36,16 +62,19 @@ def client_view(request, client_id):
 @login_required
 @user_passes_test(is_doctor, login_url='/dashboard/')
 def delete_client(request, client_id):
-    client = get_object_or_404(Client, id=client_id)
     if request.method == 'POST':
-        client.delete()
+        with transaction.atomic():
+            client = get_object_or_404(Client.objects.select_for_update(), id=client_id)
+            record_referral_change(client.referred_to_id, client.referral_status, None, None)
+            publish_referral_change(client.referred_to_id)
+            client.delete()
         return redirect('dashboard_view')
     return redirect('edit_client_medical', client_id=client_id)
 
 @login_required
 @user_passes_test(is_doctor, login_url='/dashboard/')
 def edit_client_medical(request, client_id):
-    client = get_object_or_404(Client, id=client_id)
+    client = get_object_or_404(Client.objects.select_related('medical_record'), id=client_id)
     
     if request.method == 'POST':
         form = MedicalEditForm(request.POST, instance=client)
@@ -57,6 +86,7 @@ def edit_client_medical(request, client_id):
     
     return render(request, 'core/edit_medical.html', {
         'client': client,
+        'medical': client.medical,
         'form': form  # Pass the form to template
     })
 
@@ -79,111 +109,159 @@ def add_client(request):
 
 
 @login_required
-def dashboard(request):
-    user_type = request.user.user_type
-    doctors = CustomUser.objects.filter(user_type='doctor')
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@vary_on_headers('X-Requested-With')
+async def dashboard(request):
+    # AJAX search request
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return await dashboard_search(request)
+    
+    # Regular request: template rendering and pagination stay sync. Hand
+    # over the user login_required already loaded so request.user doesn't
+    # query it again
+    request.user = await request.auser()
+    return await sync_to_async(dashboard_page)(request)
+
+@profiled('search')
+@acondition(etag_func=adashboard_etag)
+async def dashboard_search(request):
+    user = await request.auser()
     
     # All users see all clients
     clients = Client.objects.all().select_related('created_by', 'referred_to')
+    stats = await adashboard_stats(user)
+    
+    search_query = request.GET.get('q', '').strip()
+    if search_query:
+        # Ranked and capped at CLIENT_SEARCH_LIMIT by the search backend
+        # (raw FTS SQL on SQLite, so it runs in the sync thread)
+        results = await sync_to_async(profile_section(search_clients))(clients, search_query)
+    else:
+        results = [client async for client in clients[:settings.CLIENT_SEARCH_LIMIT]]
     
-    # Calculate pending referrals for doctor
-    if user_type == 'doctor':
-        pending_referrals_count = clients.filter(
-            referred_to=request.user, 
-            referral_status='pending'
-        ).count()
+    # The row cache may be a DB/file backend, so render off the event loop
+    clients_html = await sync_to_async(profile_section(render_to_string))('core/clients_table.html', {
+        'clients': results,
+        'user_type': user.user_type
+    })
     
-    # AJAX search request
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        search_query = request.GET.get('q', '').strip()
-        
-        if search_query:
-            clients = clients.filter(
-                Q(first_name__icontains=search_query) |
-                Q(last_name__icontains=search_query) |
-                Q(phone__icontains=search_query) |
-                Q(email__icontains=search_query)
-            )
-        
-        clients_html = render_to_string('core/clients_table.html', {
-            'clients': clients,
-            'user_type': user_type
-        })
-        
-        # Stats for doctor
-        if user_type == 'doctor':
-            stats = {
-                'total_clients': clients.count(),
-                'my_patients_count': clients.filter(
-                    Q(referred_to=request.user) | 
-                    Q(diagnosis__isnull=False)
-                ).distinct().count(),
-                'pending_referrals': pending_referrals_count,
-                'completed_treatments': clients.filter(
-                    treatment_plan__isnull=False,
-                    diagnosis__isnull=False
-                ).count(),
-                'new_today': clients.filter(
-                    created_at__date=timezone.now().date()
-                ).count()
-            }
-        else:
-            stats = {
-                'total_clients': clients.count(),
-                'with_diagnosis': clients.filter(diagnosis__isnull=False).count(),
-                'today_count': clients.filter(created_at__date=timezone.now().date()).count(),
-                'referred_count': clients.filter(is_referred=True).count()
-            }
-        
-        return JsonResponse({
-            'clients_html': clients_html,
-            'total_count': clients.count(),
-            'stats': stats
-        })
+    return JsonResponse({
+        'clients_html': clients_html,
+        'total_count': len(results),
+        'stats': stats
+    })
+
+@profiled('dashboard')
+@condition(etag_func=dashboard_etag)
+def dashboard_page(request):
+    user_type = request.user.user_type
     
-    # Regular request
-    total_clients = clients.count()
+    # All users see all clients
+    clients = Client.objects.all().select_related('created_by', 'referred_to')
+    page, next_cursor = paginate_clients(clients, page_size=get_page_size(request))
     
-    if user_type == 'doctor':
-        context = {
-            'user_type': user_type,
-            'doctors': doctors,
-            'clients': clients,
-            'total_clients': total_clients,
-            'my_patients_count': clients.filter(
-                Q(referred_to=request.user) | 
-                Q(diagnosis__isnull=False)
-            ).distinct().count(),
-            'pending_referrals': pending_referrals_count,
-            'completed_treatments': clients.filter(
-                treatment_plan__isnull=False,
-                diagnosis__isnull=False
-            ).count(),
-            'new_today': clients.filter(created_at__date=timezone.now().date()).count(),
-        }
-    else:
-        context = {
-            'user_type': user_type,
-            'doctors': doctors,
-            'clients': clients,
-            'total_clients': total_clients,
-            'diagnosed_count': clients.filter(diagnosis__isnull=False).count(),
-            'today_count': clients.filter(created_at__date=timezone.now().date()).count(),
-            'referred_count': clients.filter(is_referred=True).count(),
-        }
+    context = {
+        'user_type': user_type,
+        'changes_cursor': current_cursor(),
+        'doctors': doctor_directory(),
+        'clients': page,
+        'next_cursor': next_cursor,
+        **dashboard_stats(request.user),
+    }
     
     return render(request, 'core/dashboard.html', context)
 
 @login_required
+@replica_reads
+def dashboard_clients(request):
+    # "Load more" for the dashboard table, one keyset page at a time
+    clients = Client.objects.all().select_related('created_by', 'referred_to')
+
+    try:
+        page, next_cursor = paginate_clients(
+            clients,
+            cursor=request.GET.get('cursor'),
+            page_size=get_page_size(request)
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    rows_html = render_client_rows(page, request.user.user_type)
+
+    return JsonResponse({
+        'rows_html': rows_html,
+        'next_cursor': next_cursor
+    })
+
+@login_required
+def client_changes_view(request):
+    # Rows saved and ids deleted since ?since=, for patching the dashboard
+    # table in place; see core.changes
+    try:
+        changes = client_changes(request.GET.get('since', ''))
+    except InvalidChangesCursor as e:
+        return JsonResponse({'error': str(e), 'reset': True}, status=400)
+
+    rows = client_row_fragments(changes.clients, request.user.user_type)
+    return JsonResponse({
+        'changed': [[client.id, row] for client, row in zip(changes.clients, rows)],
+        'created': changes.created,
+        'deleted': changes.deleted,
+        'cursor': changes.cursor,
+        'more': changes.more,
+    })
+
+# Fields of the offline client snapshot, in row order
+SNAPSHOT_FIELDS = ['id', 'first_name', 'last_name', 'phone', 'age', 'gender',
+                   'has_diagnosis', 'referral_status', 'referred_to', 'created_at']
+
+@login_required
+def client_snapshot_view(request):
+    # Compact client rows for the service worker's IndexedDB copy; no
+    # ?since= starts a full download, paged with 'more'
+    try:
+        changes = client_changes(request.GET.get('since') or None, limit=1000)
+    except InvalidChangesCursor as e:
+        return JsonResponse({'error': str(e), 'reset': True}, status=400)
+
+    return JsonResponse({
+        'fields': SNAPSHOT_FIELDS,
+        'rows': [[
+            client.id, client.first_name, client.last_name, client.phone, client.age, client.gender,
+            client.has_diagnosis, client.referral_status if client.is_referred else '',
+            client.referred_to.username if client.referred_to else '', client.created_at,
+        ] for client in changes.clients],
+        'deleted': changes.deleted,
+        'cursor': changes.cursor,
+        'more': changes.more,
+    })
+
+@login_required
+@require_POST
+def batch_view(request):
+    # Replays the offline queue: [{key, type, data}, ...] -> one result each
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"operations": [...]}'}, status=400)
+    if not isinstance(operations, list) or len(operations) > MAX_BATCH:
+        return JsonResponse({'error': f'Send at most {MAX_BATCH} operations'}, status=400)
+    return JsonResponse({'results': apply_batch(request.user, operations)})
+
+@login_required
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=pending_referrals_etag)
 def pending_referrals_view(request):
     if request.user.user_type != 'doctor':
         return redirect('dashboard')
     
-    # Get all pending referrals
-    pending_referrals = Client.objects.filter(
+    # Get all pending referrals; referred_to is shown in every row
+    pending_referrals = list(Client.objects.filter(
         referred_to=request.user, 
         referral_status='pending'
-    ).select_related('created_by')
+    ).select_related('created_by', 'referred_to'))
     
     context = {
         'user_type': 'doctor',
@@ -194,46 +272,143 @@ def pending_referrals_view(request):
     return render(request, 'core/pending_referrals.html', context)
 
 @login_required
-def check_notifications(request):
-    if request.user.user_type != 'doctor':
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@conditional_page
+async def check_notifications(request):
+    user = await request.auser()
+    if user.user_type != 'doctor':
         return JsonResponse({'pending_referrals': 0})
     
-    pending_count = Client.objects.filter(
-        referred_to=request.user, 
-        referral_status='pending'
-    ).count()
+    metrics.inc('nova_pending_referral_polls_total', source='poll')
+    return JsonResponse({'pending_referrals': await apending_count(user.pk)})
+
+@login_required
+async def notification_stream(request):
+    user = await request.auser()
+    # Sync workers would buffer the endless stream; 204 tells EventSource
+    # to stop reconnecting so realsearch.js falls back to polling
+    if user.user_type != 'doctor' or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
     
-    return JsonResponse({'pending_referrals': pending_count})
+    metrics.inc('nova_pending_referral_polls_total', source='stream')
+    response = StreamingHttpResponse(referral_stream(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@user_passes_test(is_doctor, login_url='/dashboard/')
+@replica_reads
+def export_clients(request):
+    # ?format=csv|jsonl&from=YYYY-MM-DD&to=YYYY-MM-DD&status=pending
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse(f"format must be one of {', '.join(EXPORT_FORMATS)}", status=400)
+    try:
+        rows = export_queryset(
+            date_from=request.GET.get('from'),
+            date_to=request.GET.get('to'),
+            status=request.GET.get('status'),
+        )
+    except ExportError as e:
+        return HttpResponse(str(e), status=400)
+    # The rows are read while streaming, after @replica_reads has let go:
+    # pick the database now
+    rows = rows.using(router.db_for_read(Client))
+
+    content = export_lines(rows, fmt)
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[fmt])
+    filename = f"clients-{timezone.localdate():%Y%m%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def metrics_view(request):
+    # Staff session in the browser, bearer token for a scraper
+    token = settings.METRICS_TOKEN
+    scraper = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not scraper and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @login_required
-def refer_client(request):
+@user_passes_test(lambda user: user.is_staff, login_url='/dashboard/')
+def profiles_view(request):
+    # Saved profiles, plus a ready-made trigger link (optionally bound to one user)
+    for_user = CustomUser.objects.filter(username=request.GET.get('user', '')).first()
+    now = timezone.now()
+    return render(request, 'core/profiles.html', {
+        'profiles': list_profiles(),
+        'token': make_profile_token(for_user.pk if for_user else None),
+        'token_valid_for': timesince(now - timedelta(seconds=settings.PROFILE_TOKEN_MAX_AGE), now),
+        'for_user': for_user,
+    })
+
+@login_required
+@user_passes_test(lambda user: user.is_staff, login_url='/dashboard/')
+def profile_detail(request, profile_id):
+    sort = request.GET.get('sort', 'cumulative')
+    limit = request.GET.get('limit', '')
+    limit = min(int(limit), 500) if limit.isdigit() else 40
+    rows = top_functions(profile_id, sort=sort, limit=limit)
+    if rows is None:
+        raise Http404("No such profile")
+    return render(request, 'core/profile_detail.html', {
+        'profile_id': profile_id,
+        'rows': rows,
+        'sort': sort,
+        'sort_keys': SORT_KEYS,
+    })
+
+@login_required
+@user_passes_test(lambda user: user.is_staff, login_url='/dashboard/')
+def cache_stats(request):
+    return JsonResponse({'client_rows': row_cache_stats(), 'db_pool': pool_stats()})
+
+@login_required
+@user_passes_test(lambda user: user.is_staff, login_url='/dashboard/')
+@require_POST
+def enqueue_job(request, name):
+    # Staff: queue a maintenance job for the worker; progress is in the admin
+    if name not in JOBS:
+        raise Http404("No such job")
+    job = enqueue(name)
+    return JsonResponse({'job_id': job.id, 'status': job.status}, status=202)
+
+async def arender_client_row(client_id, user_type):
+    # The dashboard row after a change, so the page can swap it in place
+    client = await Client.objects.select_related('created_by', 'referred_to').aget(id=client_id)
+    rows = await sync_to_async(client_row_fragments)([client], user_type)
+    return rows[0]
+
+@login_required
+async def refer_client(request):
     if request.method == 'POST' and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         try:
             client_id = request.POST.get('client_id')
             referred_to_id = request.POST.get('referred_to')
             referral_notes = request.POST.get('referral_notes', '')
             
-            client = Client.objects.get(id=client_id)
-            referred_to = CustomUser.objects.get(id=referred_to_id, user_type='doctor')
-            
-            # Update referral info
-            client.referred_to = referred_to
-            client.referral_status = 'pending'
-            client.referral_notes = referral_notes
-            client.is_referred = True
-            client.referred_at = timezone.now()
-            client.referral_completed_at = None
-            client.save()
+            doctor = await afind_doctor(referred_to_id)
+            if doctor is None:
+                return JsonResponse({'success': False, 'error': 'Doctor not found'})
+            referred_to = CustomUser(id=doctor.id, username=doctor.username, user_type='doctor')
+            await arefer(client_id, referred_to, referral_notes)
+            user = await request.auser()
             
             return JsonResponse({
                 'success': True, 
-                'message': f'Client referred to Dr. {referred_to.username} successfully!'
+                'message': f'Client referred to Dr. {referred_to.username} successfully!',
+                'client_id': int(client_id),
+                'row_html': await arender_client_row(client_id, user.user_type),
             })
             
         except Client.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Client not found'})
-        except CustomUser.DoesNotExist:
-            return JsonResponse({'success': False, 'error': 'Doctor not found'})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     
@@ -253,18 +428,62 @@ def mark_referral_seen(request, client_id):
 
 
 
+def batch_client_ids(request):
+    # {"client_ids": [...], ...} from a JSON body; None if malformed
+    try:
+        data = json.loads(request.body)
+        client_ids = [int(client_id) for client_id in data['client_ids']]
+    except (ValueError, KeyError, TypeError):
+        return None, None
+    if not 0 < len(client_ids) <= MAX_BATCH_REFERRALS:
+        return None, None
+    return data, client_ids
+
+def batch_results(results):
+    return JsonResponse({
+        'success': True,
+        'results': [{'client_id': client_id, 'status': status} for client_id, status in results.items()],
+    })
+
+@login_required
+@require_POST
+async def refer_clients_batch(request):
+    # Morning intake: refer a list of clients to one doctor in one transaction
+    data, client_ids = batch_client_ids(request)
+    if data is None:
+        return JsonResponse({'success': False, 'error': f'Send 1 to {MAX_BATCH_REFERRALS} client_ids'}, status=400)
+    doctor = await afind_doctor(data.get('referred_to'))
+    if doctor is None:
+        return JsonResponse({'success': False, 'error': 'Doctor not found'}, status=400)
+
+    referred_to = CustomUser(id=doctor.id, username=doctor.username, user_type='doctor')
+    return batch_results(await arefer_many(client_ids, referred_to, str(data.get('notes', ''))))
+
 @login_required
-def complete_referral(request, client_id):
+@require_POST
+async def complete_referrals_batch(request):
+    user = await request.auser()
+    if user.user_type != 'doctor':
+        return JsonResponse({'success': False, 'error': 'Only doctors can complete referrals'}, status=403)
+    data, client_ids = batch_client_ids(request)
+    if data is None:
+        return JsonResponse({'success': False, 'error': f'Send 1 to {MAX_BATCH_REFERRALS} client_ids'}, status=400)
+    return batch_results(await acomplete_many(client_ids))
+
+@login_required
+async def complete_referral(request, client_id):
     if request.method == 'POST' and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         try:
-            client = Client.objects.get(id=client_id)
-            
-            if request.user.user_type == 'doctor':
-                client.referral_status = 'completed'
-                client.referral_completed_at = timezone.now()
-                client.save()
-                
-                return JsonResponse({'success': True, 'message': 'Referral completed!'})
+            user = await request.auser()
+            if user.user_type == 'doctor':
+                if await acomplete(client_id) == 'not_referred':
+                    return JsonResponse({'success': False, 'error': 'Client has no referral to complete'})
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Referral completed!',
+                    'client_id': client_id,
+                    'row_html': await arender_client_row(client_id, user.user_type),
+                })
             else:
                 return JsonResponse({'success': False, 'error': 'Only doctors can complete referrals'})
                 
@@ -0,0 +1,68 @@
+# Launch profile for nova/asgi.py under gunicorn + uvicorn workers:
+#   gunicorn nova.asgi:application -c gunicorn.conf.py
+# Each worker is one event loop. Async views (check_notifications, the
+# dashboard search, refer/complete, the SSE stream) wait on the database
+# without holding the worker, so a slow Supabase round trip no longer
+# queues every other doctor's poll behind it. Sync views still run, one
+# thread per request, via Django's sync_to_async.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+# Keep WEB_CONCURRENCY x DB_POOL_MAX_SIZE under the pooler's connection limit
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2, 4)))
+
+# For uvicorn workers this is a heartbeat, not a per-request limit: it only
+# fires when something blocks the event loop, so long SSE streams are fine
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers now and then so per-process caches and leaks stay bounded
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+
+accesslog = '-'
+
+
+def on_starting(server):
+    # Start each deploy's /metrics from zero; workers that exit during this
+    # run are folded into retired.json so counters never go backwards
+    import glob
+
+    for path in glob.glob(os.path.join(metrics_dir(), 'worker-*.json')):
+        os.remove(path)
+    retired = os.path.join(metrics_dir(), 'retired.json')
+    if os.path.exists(retired):
+        os.remove(retired)
+
+
+def worker_exit(server, worker):
+    # Last flush, so the final seconds of a recycled worker are counted
+    from django.conf import settings
+    from core.metrics import flush
+    try:
+        if settings.METRICS_ENABLED:
+            flush()
+    except Exception:
+        server.log.exception("Final metrics flush failed")
+
+
+def child_exit(server, worker):
+    # Fold the exited worker's snapshot into retired.json; without this
+    # every max_requests recycle leaves a file /metrics reads forever
+    from core.metrics import retire_worker
+    try:
+        retire_worker(metrics_dir(), worker.pid)
+    except Exception:
+        server.log.exception("Retiring metrics of worker %s failed", worker.pid)
+
+
+def metrics_dir():
+    # The master never sets Django up; read METRICS_DIR from the settings
+    # module itself so it can't disagree with where workers write
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nova.settings')
+    from django.conf import settings
+    return settings.METRICS_DIR
@@ -0,0 +1,269 @@
+// offline.js - IndexedDB copy of the client list and the offline write queue
+//
+// The client list is kept in step through /api/clients/snapshot; new clients
+// and referrals made without a connection are queued here and replayed in
+// one POST to /api/batch once it returns. Every queued operation carries an
+// idempotency key, so replaying a batch twice never writes twice.
+
+const NovaOffline = (function() {
+    const DB_NAME = 'nova-offline';
+    const BATCH_SIZE = 100;
+    let dbPromise = null;
+    let replaying = false;
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, 1);
+                request.onupgradeneeded = function() {
+                    const db = request.result;
+                    db.createObjectStore('clients', { keyPath: 'id' });
+                    db.createObjectStore('queue', { keyPath: 'key' });
+                    db.createObjectStore('meta', { keyPath: 'name' });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Run fn(stores) in one transaction; resolves with fn's result once committed
+    function withStores(names, mode, fn) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const transaction = db.transaction(names, mode);
+            const stores = names.map(name => transaction.objectStore(name));
+            let result;
+            Promise.resolve(fn(...stores)).then(value => { result = value; });
+            transaction.oncomplete = () => resolve(result);
+            transaction.onerror = () => reject(transaction.error);
+        }));
+    }
+
+    function requestResult(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    function getJson(url) {
+        return fetch(url, {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        }).then(response => {
+            // Logged out: the login page comes back instead of JSON
+            if (response.redirected) throw new Error('Not logged in');
+            return response.json();
+        });
+    }
+
+    // Pull everything changed since the stored cursor, page by page
+    async function syncSnapshot() {
+        let cursor = await withStores(['meta'], 'readonly', meta => requestResult(meta.get('snapshot_cursor')));
+        cursor = cursor ? cursor.value : '';
+
+        for (;;) {
+            const data = await getJson(`/api/clients/snapshot?since=${encodeURIComponent(cursor)}`);
+            if (data.reset) {
+                // Too long offline for the change history: start over
+                await withStores(['clients'], 'readwrite', clients => clients.clear());
+                cursor = '';
+                continue;
+            }
+            await withStores(['clients', 'meta'], 'readwrite', (clients, meta) => {
+                data.rows.forEach(row => {
+                    const client = {};
+                    data.fields.forEach((field, i) => { client[field] = row[i]; });
+                    clients.put(client);
+                });
+                data.deleted.forEach(id => clients.delete(id));
+                meta.put({ name: 'snapshot_cursor', value: data.cursor });
+            });
+            cursor = data.cursor;
+            if (!data.more) return;
+        }
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    async function queue(type, data) {
+        const operation = { key: newKey(), type: type, data: data, queuedAt: Date.now() };
+        await withStores(['queue'], 'readwrite', store => store.put(operation));
+        updateBanner();
+        return operation.key;
+    }
+
+    function queued() {
+        return withStores(['queue'], 'readonly', store => requestResult(store.getAll()))
+            .then(operations => operations.sort((a, b) => a.queuedAt - b.queuedAt));
+    }
+
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    // Send the queue in batches; each operation leaves the queue once the
+    // server has a result for it, applied or rejected
+    async function replay() {
+        if (replaying || !navigator.onLine) return 0;
+        replaying = true;
+        let sent = 0;
+        try {
+            const operations = await queued();
+            for (let i = 0; i < operations.length; i += BATCH_SIZE) {
+                const batch = operations.slice(i, i + BATCH_SIZE);
+                const response = await fetch('/api/batch', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-Requested-With': 'XMLHttpRequest',
+                        'X-CSRFToken': csrfToken(),
+                    },
+                    body: JSON.stringify({
+                        operations: batch.map(op => ({ key: op.key, type: op.type, data: op.data }))
+                    }),
+                });
+                if (!response.ok || response.redirected) break;
+
+                const results = (await response.json()).results;
+                await withStores(['queue'], 'readwrite', store => {
+                    results.forEach(result => store.delete(result.key));
+                });
+                results.filter(result => !result.ok).forEach(result => {
+                    const errors = Object.values(result.errors || {}).flat().join(' ');
+                    notify(`A change saved offline was rejected: ${errors}`, 'error');
+                });
+                sent += results.filter(result => result.ok).length;
+            }
+        } catch (error) {
+            console.error('Offline replay error:', error);
+        } finally {
+            replaying = false;
+            updateBanner();
+        }
+        if (sent) {
+            notify(`${sent} change(s) made offline were saved`, 'success');
+            // Show them in the dashboard table (realsearch.js)
+            if (typeof syncClientChanges === 'function') syncClientChanges();
+        }
+        return sent;
+    }
+
+    function search(query) {
+        const needle = query.toLowerCase();
+        const digits = query.replace(/\D/g, '');
+        return withStores(['clients'], 'readonly', store => requestResult(store.getAll()))
+            .then(clients => clients.filter(client =>
+                `${client.first_name} ${client.last_name}`.toLowerCase().includes(needle) ||
+                (digits && client.phone.replace(/\D/g, '').includes(digits))
+            ).sort((a, b) => b.id - a.id).slice(0, 100));
+    }
+
+    function escapeHtml(value) {
+        const div = document.createElement('div');
+        div.textContent = value == null ? '' : String(value);
+        return div.innerHTML;
+    }
+
+    // A plain table for offline search results; the full rows need the server
+    function renderTable(clients) {
+        if (!clients.length) {
+            return '<p class="text-gray-500 py-8 text-center">No saved clients match (offline)</p>';
+        }
+        const rows = clients.map(client => `
+            <tr>
+                <td class="px-6 py-4 text-sm font-medium text-gray-900">${escapeHtml(client.first_name)} ${escapeHtml(client.last_name)}</td>
+                <td class="px-6 py-4 text-sm text-gray-900">${escapeHtml(client.phone)}</td>
+                <td class="px-6 py-4 text-sm text-gray-500">Age ${escapeHtml(client.age)}</td>
+                <td class="px-6 py-4 text-sm text-gray-500">${client.referred_to ? 'Referred to Dr. ' + escapeHtml(client.referred_to) : 'Not Referred'}</td>
+            </tr>`).join('');
+        return `
+            <p class="text-sm text-yellow-700 mb-2"><i class="fas fa-wifi mr-1"></i>Offline - showing the saved client list</p>
+            <div class="bg-white rounded-lg shadow overflow-hidden">
+                <table class="min-w-full divide-y divide-gray-200">
+                    <tbody class="bg-white divide-y divide-gray-200">${rows}</tbody>
+                </table>
+            </div>`;
+    }
+
+    function notify(message, type) {
+        if (typeof showNotification === 'function') {
+            showNotification(message, type);
+        } else {
+            console.log(message);
+        }
+    }
+
+    function updateBanner() {
+        queued().then(operations => {
+            let banner = document.getElementById('offline-banner');
+            if (navigator.onLine && !operations.length) {
+                if (banner) banner.remove();
+                return;
+            }
+            if (!banner) {
+                banner = document.createElement('div');
+                banner.id = 'offline-banner';
+                banner.className = 'fixed bottom-4 left-4 px-4 py-2 rounded-lg shadow-lg bg-yellow-500 text-white text-sm z-50';
+                document.body.appendChild(banner);
+            }
+            const pending = operations.length ? ` - ${operations.length} change(s) waiting to be sent` : '';
+            banner.textContent = (navigator.onLine ? 'Sending saved changes' : 'Offline') + pending;
+        }).catch(() => {});
+    }
+
+    function isNetworkError(error) {
+        // fetch() only rejects with a TypeError when the request never got an answer
+        return error instanceof TypeError || !navigator.onLine;
+    }
+
+    // Queue the add-client form instead of posting it while offline
+    function initAddClientForm() {
+        const form = document.querySelector('form[data-offline-queue="add_client"]');
+        if (!form) return;
+        form.addEventListener('submit', function(e) {
+            if (navigator.onLine) return;
+            e.preventDefault();
+            if (!form.reportValidity()) return;
+
+            const data = Object.fromEntries(new FormData(form));
+            delete data.csrfmiddlewaretoken;
+            queue('add_client', data).then(() => {
+                notify('Offline - the client will be registered when the connection returns', 'success');
+                form.reset();
+            });
+        });
+    }
+
+    function start() {
+        if (!window.indexedDB) return;
+        initAddClientForm();
+        updateBanner();
+        window.addEventListener('offline', updateBanner);
+        window.addEventListener('online', function() {
+            replay().then(() => syncSnapshot()).catch(error => console.error('Offline sync error:', error));
+        });
+
+        // Only pages behind the login keep the copy fresh
+        if (document.getElementById('regular-clients-container') && navigator.onLine) {
+            replay().then(() => syncSnapshot()).catch(error => console.error('Offline sync error:', error));
+        } else {
+            replay();
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', start);
+
+    return {
+        queue: queue,
+        replay: replay,
+        syncSnapshot: syncSnapshot,
+        search: search,
+        renderTable: renderTable,
+        isNetworkError: isNetworkError,
+    };
+})();
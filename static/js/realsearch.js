@@ -75,6 +75,16 @@ document.addEventListener('DOMContentLoaded', function() {
             })
             .catch(error => {
                 console.error('Search error:', error);
+                if (window.NovaOffline && NovaOffline.isNetworkError(error)) {
+                    // Search the saved copy of the client list instead
+                    return NovaOffline.search(query).then(clients => {
+                        clientsContainer.innerHTML = NovaOffline.renderTable(clients);
+                        if (searchInput.value.trim() !== '') {
+                            if (searchResultsContainer) searchResultsContainer.classList.remove('hidden');
+                            if (regularClientsSection) regularClientsSection.classList.add('hidden');
+                        }
+                    });
+                }
             })
             .finally(() => {
                 if (searchLoading) searchLoading.classList.add('hidden');
@@ -86,6 +96,46 @@ document.addEventListener('DOMContentLoaded', function() {
         if (regularClientsSection) regularClientsSection.classList.remove('hidden');
     }
 
+    // Load more / infinite scroll for the regular clients table
+    const loadMore = document.getElementById('load-more-clients');
+    const loadMoreButton = document.getElementById('load-more-button');
+    const regularRows = document.querySelector('#regular-clients-container .client-rows');
+
+    if (loadMore && loadMoreButton && regularRows) {
+        console.log('Initializing load more');
+        let loadingPage = false;
+
+        function loadNextPage() {
+            const cursor = loadMore.dataset.nextCursor;
+            if (!cursor || loadingPage) return;
+            loadingPage = true;
+
+            fetch(`${loadMore.dataset.url}?cursor=${encodeURIComponent(cursor)}`, {
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            })
+            .then(response => response.json())
+            .then(data => {
+                regularRows.insertAdjacentHTML('beforeend', data.rows_html || '');
+                loadMore.dataset.nextCursor = data.next_cursor || '';
+                if (!data.next_cursor) loadMore.classList.add('hidden');
+            })
+            .catch(error => console.error('Load more error:', error))
+            .finally(() => {
+                loadingPage = false;
+            });
+        }
+
+        loadMoreButton.addEventListener('click', loadNextPage);
+
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+            }, { rootMargin: '200px' }).observe(loadMore);
+        }
+    }
+
     // ... rest of your existing code (referral modal, completeReferral, etc.)
     // Initialize referral modal if elements exist
     const referralForm = document.getElementById('referralForm');
@@ -117,7 +167,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (data.success) {
                     closeReferralModal();
                     showNotification(data.message, 'success');
-                    setTimeout(() => window.location.reload(), 1500);
+                    replaceClientRow(data.client_id, data.row_html);
+                    submitBtn.innerHTML = originalText;
+                    submitBtn.disabled = false;
+                    syncClientChanges();
                 } else {
                     showNotification(data.error || 'Error referring client', 'error');
                     submitBtn.innerHTML = originalText;
@@ -126,9 +179,20 @@ document.addEventListener('DOMContentLoaded', function() {
             })
             .catch(error => {
                 console.error('Error:', error);
-                showNotification('Error referring client', 'error');
                 submitBtn.innerHTML = originalText;
                 submitBtn.disabled = false;
+                if (window.NovaOffline && NovaOffline.isNetworkError(error)) {
+                    NovaOffline.queue('refer', {
+                        client_id: formData.get('client_id'),
+                        referred_to: formData.get('referred_to'),
+                        notes: formData.get('referral_notes') || '',
+                    }).then(() => {
+                        closeReferralModal();
+                        showNotification('Offline - the referral will be sent when the connection returns', 'success');
+                    });
+                    return;
+                }
+                showNotification('Error referring client', 'error');
             });
         });
         
@@ -139,6 +203,12 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Keep the clients table current from /api/clients/changes
+    syncClientChanges = createChangeSync();
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible') syncClientChanges();
+    });
+
     // Initialize auto-refresh for doctors
     if (document.body.classList.contains('doctor-dashboard')) {
         console.log('Initializing auto-refresh for doctor');
@@ -146,6 +216,79 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// Replace every rendered row of a client (regular table and search
+// results); returns false when the page shows no row for it
+function replaceClientRow(clientId, html) {
+    const rows = document.querySelectorAll(`tr[data-client-id="${clientId}"]`);
+    rows.forEach(row => {
+        row.outerHTML = html;
+    });
+    return rows.length > 0;
+}
+
+let syncClientChanges = function() {};
+
+// Fetch what changed since the cursor the page was rendered with and patch
+// the table: saved rows are swapped, new ones go on top, deleted ones go.
+// Returns a no-op where there is no clients table.
+function createChangeSync() {
+    const container = document.getElementById('regular-clients-container');
+    if (!container || !container.dataset.changesUrl) {
+        return function() {};
+    }
+    let syncing = false;
+    let again = false;
+
+    function sync() {
+        if (syncing) {
+            again = true;
+            return;
+        }
+        syncing = true;
+        const cursor = encodeURIComponent(container.dataset.changesCursor);
+
+        fetch(`${container.dataset.changesUrl}?since=${cursor}`, {
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.reset) {
+                // Cursor too old for the change history
+                window.location.reload();
+                return;
+            }
+            const created = new Set(data.created);
+            const rows = container.querySelector('.client-rows');
+            data.changed.forEach(([clientId, html]) => {
+                if (replaceClientRow(clientId, html) || !created.has(clientId)) return;
+                if (rows) {
+                    rows.insertAdjacentHTML('afterbegin', html);
+                } else {
+                    // First client on an empty dashboard
+                    window.location.reload();
+                }
+            });
+            data.deleted.forEach(clientId => {
+                document.querySelectorAll(`tr[data-client-id="${clientId}"]`).forEach(row => row.remove());
+            });
+            container.dataset.changesCursor = data.cursor;
+            if (data.more) again = true;
+        })
+        .catch(error => console.error('Change sync error:', error))
+        .finally(() => {
+            syncing = false;
+            if (again) {
+                again = false;
+                sync();
+            }
+        });
+    }
+
+    return sync;
+}
+
 // Modal control functions
 function openReferralModal(clientId) {
     const modal = document.getElementById('referralModal');
@@ -192,9 +335,14 @@ function completeReferral(clientId) {
     .then(data => {
         if (data.success) {
             showNotification(data.message || 'Referral completed successfully!', 'success');
-            setTimeout(() => {
-                window.location.reload();
-            }, 1000);
+            // Dashboard rows are patched in place; other pages still reload
+            if (replaceClientRow(data.client_id, data.row_html)) {
+                syncClientChanges();
+            } else {
+                setTimeout(() => {
+                    window.location.reload();
+                }, 1000);
+            }
         } else {
             showNotification(data.error || 'Error completing referral', 'error');
         }
@@ -205,8 +353,31 @@ function completeReferral(clientId) {
     });
 }
 
-// Auto-refresh function
+// Auto-refresh function: Server-Sent Events, polling only as a fallback
 function initializeAutoRefresh() {
+    let pollTimer = null;
+
+    function updateNotificationBadges(pendingReferrals) {
+        const pendingElement = document.getElementById('pending-referrals');
+        if (pendingElement) {
+            pendingElement.textContent = pendingReferrals;
+        }
+        
+        const navBadges = document.querySelectorAll('.navbar-notification-badge');
+        navBadges.forEach(badge => {
+            if (badge) {
+                badge.textContent = pendingReferrals;
+                if (pendingReferrals > 0) {
+                    badge.classList.remove('hidden');
+                } else {
+                    badge.classList.add('hidden');
+                }
+            }
+        });
+    }
+
+    let lastPending = null;
+
     function refreshNotifications() {
         fetch('/check-notifications/', {
             headers: {
@@ -215,28 +386,46 @@ function initializeAutoRefresh() {
         })
         .then(response => response.json())
         .then(data => {
-            const pendingElement = document.getElementById('pending-referrals');
-            if (pendingElement) {
-                pendingElement.textContent = data.pending_referrals;
-            }
-            
-            const navBadges = document.querySelectorAll('.navbar-notification-badge');
-            navBadges.forEach(badge => {
-                if (badge) {
-                    badge.textContent = data.pending_referrals;
-                    if (data.pending_referrals > 0) {
-                        badge.classList.remove('hidden');
-                    } else {
-                        badge.classList.add('hidden');
-                    }
-                }
-            });
+            updateNotificationBadges(data.pending_referrals);
+            if (lastPending !== null && data.pending_referrals !== lastPending) syncClientChanges();
+            lastPending = data.pending_referrals;
         })
         .catch(error => console.error('Notification refresh error:', error));
     }
-    
-    setInterval(refreshNotifications, 5000);
-    refreshNotifications();
+
+    function startPolling() {
+        if (pollTimer) return;
+        console.log('Falling back to notification polling');
+        pollTimer = setInterval(refreshNotifications, 5000);
+        refreshNotifications();
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const source = new EventSource('/notifications/stream/');
+
+    source.addEventListener('referrals', function(e) {
+        updateNotificationBadges(JSON.parse(e.data).pending_referrals);
+        syncClientChanges();
+    });
+
+    source.onopen = function() {
+        if (pollTimer) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    };
+
+    // CLOSED means the server refused the stream (e.g. sync worker);
+    // otherwise EventSource is already reconnecting on its own
+    source.onerror = function() {
+        if (source.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    };
 }
 
 // Helper function to get CSRF token
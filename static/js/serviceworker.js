@@ -0,0 +1,140 @@
+// Nova service worker (served by django-pwa at /serviceworker.js, see
+// PWA_SERVICE_WORKER_PATH): our scripts and pages network first with the
+// last copy as a fallback, other static files from the cache (refreshed in
+// the background), and /offline/ for pages never seen. Static URLs aren't
+// hashed, so nothing of ours may be served from the cache without asking
+// the network first or after. The client list and write queue are
+// IndexedDB, in static/js/offline.js.
+
+const VERSION = 'nova-v2';
+const SHELL_CACHE = `${VERSION}-shell`;
+const PAGE_CACHE = `${VERSION}-pages`;
+const OFFLINE_DB = 'nova-offline';
+
+const SHELL = [
+    '/offline/',
+    '/static/js/realsearch.js',
+    '/static/js/offline.js',
+    '/static/js/hamburger_view.js',
+    '/static/images/android-chrome-192x192.png',
+    '/static/images/android-chrome-512x512.png',
+];
+// Tailwind and Font Awesome come from CDNs; cached as opaque responses
+const CDN_HOSTS = ['cdn.tailwindcss.com', 'cdnjs.cloudflare.com'];
+const CDN_SHELL = [
+    'https://cdn.tailwindcss.com',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+];
+// Always live: JSON APIs, event streams and the service worker itself
+const NETWORK_ONLY = ['/api/', '/check-notifications/', '/notifications/', '/metrics', '/serviceworker.js', '/admin/'];
+
+self.addEventListener('install', event => {
+    self.skipWaiting();
+    event.waitUntil(
+        caches.open(SHELL_CACHE).then(cache => Promise.all([
+            cache.addAll(SHELL),
+            ...CDN_SHELL.map(url => fetch(new Request(url, { mode: 'no-cors' }))
+                .then(response => cache.put(url, response))
+                .catch(() => {})),
+        ]))
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(
+                names.filter(name => !name.startsWith(VERSION)).map(name => caches.delete(name))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Logging out drops everything cached for the user
+function clearUserData() {
+    return Promise.all([
+        caches.delete(PAGE_CACHE),
+        new Promise(resolve => {
+            const request = indexedDB.deleteDatabase(OFFLINE_DB);
+            request.onsuccess = request.onerror = request.onblocked = () => resolve();
+        }),
+    ]);
+}
+
+function networkFirstPage(request) {
+    return fetch(request)
+        .then(response => {
+            // Redirects are usually the login page; don't keep those
+            if (response.ok && !response.redirected) {
+                const copy = response.clone();
+                caches.open(PAGE_CACHE).then(cache => cache.put(request, copy));
+            }
+            return response;
+        })
+        .catch(() => caches.match(request, { ignoreSearch: true })
+            .then(cached => cached || caches.match('/offline/')));
+}
+
+// Our JavaScript: a deploy must reach users on their next load
+function networkFirstScript(request) {
+    return fetch(request)
+        .then(response => {
+            if (response.ok) {
+                const copy = response.clone();
+                caches.open(SHELL_CACHE).then(cache => cache.put(request, copy));
+            }
+            return response;
+        })
+        .catch(() => caches.match(request, { ignoreSearch: true })
+            .then(cached => cached || Response.error()));
+}
+
+// Images and the like: answer from the cache, refresh it for next time
+function staleWhileRevalidate(event) {
+    const request = event.request;
+    const refresh = fetch(request).then(response => {
+        if (response.ok) {
+            const copy = response.clone();
+            caches.open(SHELL_CACHE).then(cache => cache.put(request, copy));
+        }
+        return response;
+    });
+    event.waitUntil(refresh.catch(() => {}));
+    return caches.match(request).then(cached => cached || refresh);
+}
+
+// CDN files have versioned URLs
+function cacheFirst(request) {
+    return caches.match(request).then(cached => cached || fetch(request).then(response => {
+        if (response.ok || response.type === 'opaque') {
+            const copy = response.clone();
+            caches.open(SHELL_CACHE).then(cache => cache.put(request, copy));
+        }
+        return response;
+    }));
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (request.method !== 'GET') {
+        if (url.origin === self.location.origin && url.pathname === '/logout/') {
+            event.waitUntil(clearUserData());
+        }
+        return;
+    }
+
+    if (url.origin === self.location.origin) {
+        if (NETWORK_ONLY.some(prefix => url.pathname.startsWith(prefix))) return;
+        if (url.pathname.startsWith('/static/js/')) {
+            event.respondWith(networkFirstScript(request));
+        } else if (url.pathname.startsWith('/static/')) {
+            event.respondWith(staleWhileRevalidate(event));
+        } else if (request.mode === 'navigate') {
+            event.respondWith(networkFirstPage(request));
+        }
+    } else if (CDN_HOSTS.includes(url.hostname)) {
+        event.respondWith(cacheFirst(request));
+    }
+});